@@ -0,0 +1,153 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Measure the stream disruption of the CornerDetect algorithm swap
+
+The synthetic overlay mirrors the CornerDetect pipeline
+
+    vii -> dup -> [[r2g, pr_0 or pr_1, g2r], [1]] -> add -> vio
+
+and each run composes it, then measures two updates with the reset policies
+of Composable, 'edits' only differs from 'routing' on the swap
+
+    swap      replace the pr_0 IP with the pr_1 IP, what _swap does
+    retune    recompose the same pipeline after changing one parameter
+
+Reported per update: soft reset pulses, IP starts, switch registers
+written, the compose time and the downtime, the time from the soft reset
+pulse to the end of the last IP start, during which every stream of the
+hierarchy is interrupted. Without a soft reset pulse the downtime is zero.
+Times are the best of --repeat runs. Results are written as JSON
+
+    python benchmarks/compose_downtime.py --output downtime.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from benchmarks.compose_scaling import _composable, _IP  # noqa: E402
+from pynq_composable.composable import Composable  # noqa: E402
+from tests.hwh_generator import write_overlay  # noqa: E402
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+
+class _Reset:
+    """Soft reset GPIO stand-in that keeps the time of the last pulse"""
+
+    def __init__(self):
+        self.pulses = 0
+        self.asserted = None
+
+    def write(self, value):
+        if value:
+            self.pulses += 1
+            self.asserted = time.perf_counter()
+
+
+class _ConfigIP(_IP):
+    """IP stand-in with a fingerprint that keeps the end of its last start"""
+
+    def __init__(self, fullpath: str):
+        super().__init__(fullpath)
+        self.threshold = 20
+        self.started = 0
+        self.end = None
+
+    def _fingerprint(self):
+        return (self.threshold,)
+
+    def start(self):
+        self.started += 1
+        self.end = time.perf_counter()
+
+
+def _update(cpipe: Composable, ips: list, update) -> dict:
+    reset = cpipe._soft_reset[0]
+    pulses, writes = reset.pulses, cpipe._switch.register_writes
+    starts = sum(ip.started for ip in ips)
+    reset.asserted = None
+    start = time.perf_counter()
+    update()
+    elapsed = time.perf_counter() - start
+    downtime = 0.0
+    if reset.asserted is not None:
+        downtime = max(ip.end for ip in ips) - reset.asserted
+    return {'resets': reset.pulses - pulses,
+            'starts': sum(ip.started for ip in ips) - starts,
+            'switch_writes': cpipe._switch.register_writes - writes,
+            'time': elapsed, 'downtime': downtime}
+
+
+def measure(hwh: str, policy: str, repeat: int) -> dict:
+    """Return the best swap and retune measurements for a reset policy"""
+
+    best = dict()
+    for _ in range(repeat):
+        cpipe = _composable(hwh, ports=9)
+        cpipe.reset_policy = policy
+        cpipe._soft_reset = [_Reset()]
+        vii, r2g, g2r, vio, dup, add, fast, harr = [
+            _ConfigIP('composable/' + n) for n in [
+                'ip0_accel', 'ip1_accel', 'ip2_accel', 'ip3_accel',
+                'fork_accel', 'join_accel', 'pr_0/fn0_accel',
+                'pr_1/fn0_accel']]
+        ips = [vii, r2g, g2r, vio, dup, add, fast, harr]
+        cpipe.compose([vii, dup, [[r2g, fast, g2r], [1]], add, vio])
+
+        def swap():
+            cpipe.replace((fast, harr))
+
+        def retune():
+            harr.threshold += 1
+            cpipe.compose(cpipe.current_pipeline)
+
+        for name, update in [('swap', swap), ('retune', retune)]:
+            result = _update(cpipe, ips, update)
+            if name not in best or result['time'] < best[name]['time']:
+                best[name] = result
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the CornerDetect swap downtime"
+    )
+    parser.add_argument(
+        "--output", help="JSON output file, default stdout"
+    )
+    parser.add_argument(
+        "--repeat", help="runs for each measurement", type=int, default=20
+    )
+    args = parser.parse_args()
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['PYNQ_COMPOSABLE_CACHE_DIR'] = os.path.join(tmpdir,
+                                                               'cache')
+        hwh = write_overlay(tmpdir, static=4, regions=2, rms=2, branches=2)
+        for policy in ['always', 'routing', 'edits']:
+            results[policy] = measure(hwh, policy, args.repeat)
+            for name, r in results[policy].items():
+                print("{:7s} {:6s}  resets {}  starts {}  switch writes {}  "
+                      "{:7.1f} us  downtime {:7.1f} us"
+                      .format(policy, name, r['resets'], r['starts'],
+                              r['switch_writes'], r['time'] * 1e6,
+                              r['downtime'] * 1e6), file=sys.stderr)
+
+    report = {'python': platform.python_version(), 'repeat': args.repeat,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
@@ -0,0 +1,152 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Time Composable.plan on synthetic 64-port switches
+
+A synthetic overlay is written with tests/hwh_generator.py and a Composable
+object is built on top of it without hardware. Each scale point plans a
+linear pipeline or a pipeline with nested fork/join branches, the plan cache
+is cleared before every run so the routing is measured. Times are the best
+of --repeat runs of --number plans. Results are written as JSON
+
+    python benchmarks/compose_scaling.py --output compose.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pynq_composable.composable import Composable  # noqa: E402
+from tests.hwh_generator import synthetic_composable  # noqa: E402
+from tests.hwh_generator import write_overlay  # noqa: E402
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+
+_ports = 64
+_forks = 8
+_branches = 2
+_static = _ports - _forks * (_branches + 1)
+
+
+class _Switch:
+    """AXI4-Stream Switch stand-in that counts the registers written"""
+
+    def __init__(self, max_slots: int):
+        self.max_slots = max_slots
+        self.register_writes = 0
+        self._pi = np.ones(max_slots, dtype=np.int64) * -1
+
+    @property
+    def pi(self):
+        return np.copy(self._pi)
+
+    @pi.setter
+    def pi(self, value):
+        self.register_writes += int(np.count_nonzero(value != self._pi))
+        self._pi = np.copy(value)
+
+
+class _IP:
+    """IP object stand-in"""
+
+    def __init__(self, fullpath: str):
+        self._fullpath = fullpath
+
+    def start(self):
+        pass
+
+
+def _composable(hwh: str, ports: int = _ports) -> Composable:
+    """Composable object for a synthetic overlay without hardware"""
+
+    return synthetic_composable(hwh, _Switch(ports))
+
+
+def _linear(length: int) -> list:
+    return [_IP('composable/ip{}_accel'.format(i)) for i in range(length)]
+
+
+def _nested(depth: int) -> list:
+    """Pipeline with depth fork/join pairs, each one inside the previous"""
+
+    def level(d: int) -> list:
+        ip = _IP('composable/ip{}_accel'.format(d))
+        if d == depth:
+            return [ip]
+        suffix = '_{}'.format(d) if d else ''
+        return [ip, _IP('composable/fork_accel' + suffix),
+                [level(d + 1), [1]], _IP('composable/join_accel' + suffix)]
+
+    return level(0) + [_IP('composable/ip{}_accel'.format(_static - 1))]
+
+
+def measure(cpipe: Composable, pipeline: list, repeat: int,
+            number: int) -> dict:
+    """Return the best time of a plan and the number of connections"""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            cpipe._plans.clear()
+            cpipe.plan(pipeline)
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    edges = len(cpipe._compile(pipeline).edges)
+    return {'time': best, 'edges': edges}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark Composable.plan on 64-port switches"
+    )
+    parser.add_argument(
+        "--output", help="JSON output file, default stdout"
+    )
+    parser.add_argument(
+        "--repeat", help="runs for each measurement", type=int, default=5
+    )
+    parser.add_argument(
+        "--number", help="plans for each run", type=int, default=100
+    )
+    args = parser.parse_args()
+
+    results = list()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['PYNQ_COMPOSABLE_CACHE_DIR'] = os.path.join(tmpdir,
+                                                               'cache')
+        hwh = write_overlay(tmpdir, static=_static, regions=0,
+                            branches=_branches, forks=_forks)
+        cpipe = _composable(hwh)
+        points = [('linear', n, _linear(n)) for n in [8, 16, 32, _static]]
+        points += [('nested', d, _nested(d)) for d in [1, 2, 4, _forks]]
+        for layout, size, pipeline in points:
+            point = {'layout': layout, 'size': size}
+            point.update(measure(cpipe, pipeline, args.repeat, args.number))
+            results.append(point)
+            print("{:6s} {:3d}  edges {:3d}  {:8.1f} us  {:6.2f} us/edge  "
+                  "{:8.0f} plans/s"
+                  .format(layout, size, point['edges'], point['time'] * 1e6,
+                          point['time'] * 1e6 / point['edges'],
+                          1 / point['time']),
+                  file=sys.stderr)
+
+    report = {'python': platform.python_version(), 'ports': _ports,
+              'repeat': args.repeat, 'number': args.number,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
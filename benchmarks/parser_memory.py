@@ -0,0 +1,65 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Compare the peak memory of the DOM and streaming HWH discovery
+
+The HWH file is copied to a temporary directory, which is also used as
+cache directory, so the cache files written by the parser do not modify the
+source tree or the user cache
+
+    python benchmarks/parser_memory.py --hwh tests/cv_dfx_2pipes.hwh
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pynq_composable.parser import HWHComposable  # noqa: E402
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+
+def measure(hwh: str, switch: str, streaming: bool) -> tuple:
+    """Return peak traced memory in bytes and elapsed time in seconds"""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    HWHComposable(hwh, switch, cache=False, streaming=streaming)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure HWH discovery peak memory"
+    )
+    parser.add_argument(
+        "--hwh", help="global hwh file",
+        default=os.path.join(os.path.dirname(__file__), '..', 'tests',
+                             'cv_dfx_2pipes.hwh')
+    )
+    parser.add_argument(
+        "--switch", help="AXI4-Stream Switch name",
+        default="pipeline0/axis_switch"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        hwh = shutil.copy(args.hwh, tmpdir)
+        os.environ['PYNQ_COMPOSABLE_CACHE_DIR'] = tmpdir
+        size = os.path.getsize(hwh)
+        print("{}: {:.2f} MiB".format(args.hwh, size / 2**20))
+        for mode, streaming in [('dom', False), ('streaming', True)]:
+            peak, elapsed = measure(hwh, args.switch, streaming)
+            print("{:<10} peak {:8.2f} MiB  time {:6.3f} s"
+                  .format(mode, peak / 2**20, elapsed))
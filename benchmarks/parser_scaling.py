@@ -0,0 +1,148 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Time the HWH discovery on synthetic overlays of increasing size
+
+Each scale point writes a synthetic overlay with tests/hwh_generator.py and
+measures HWHComposable with an empty cache (cold) and with the cache written
+by the cold run (warm). Times are the best of --repeat runs, peak and
+retained memory, the memory still held by the HWHComposable object, are
+measured in a separate run under tracemalloc. With --lazy the partial HWH
+files are not parsed by the cold run. Results are written as JSON
+
+    python benchmarks/parser_scaling.py --output scaling.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pynq_composable import cache  # noqa: E402
+from pynq_composable.parser import HWHComposable  # noqa: E402
+from tests.hwh_generator import write_overlay  # noqa: E402
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+
+_chain = ('axis_data_fifo', 'axis_register_slice')
+
+# (static IP, chain depth, DFX regions, RMs per region)
+_scale_points = [
+    (4, 0, 1, 2),
+    (16, 2, 2, 4),
+    (32, 4, 4, 8),
+    (60, 8, 4, 16)
+]
+
+
+def _run(hwh: str, switch: str, cold: bool, options: dict) -> HWHComposable:
+    if cold:
+        cache.clear()
+    return HWHComposable(hwh, switch, **options)
+
+
+def measure(hwh: str, switch: str, cold: bool, options: dict,
+            repeat: int) -> dict:
+    """Return the best elapsed time, the peak and retained memory and the
+    phase timing
+    """
+
+    elapsed = list()
+    for _ in range(repeat):
+        if not cold:
+            _run(hwh, switch, False, options)
+        start = time.perf_counter()
+        hwhparser = _run(hwh, switch, cold, options)
+        elapsed.append(time.perf_counter() - start)
+
+    if not cold:
+        _run(hwh, switch, False, options)
+    tracemalloc.start()
+    hwhtraced = _run(hwh, switch, cold, options)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del hwhtraced
+    return {'time': min(elapsed), 'peak': peak, 'retained': retained,
+            'timing': hwhparser.timing}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd=os.path.dirname(__file__),
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the HWH discovery on synthetic overlays"
+    )
+    parser.add_argument(
+        "--output", help="JSON output file, default stdout"
+    )
+    parser.add_argument(
+        "--repeat", help="runs for each measurement", type=int, default=3
+    )
+    parser.add_argument(
+        "--workers", help="processes used to parse partial hwh files",
+        type=int, default=None
+    )
+    parser.add_argument(
+        "--streaming", help="parse the hwh file incrementally",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--lazy", help="do not parse the partial hwh files up front",
+        action="store_true"
+    )
+    args = parser.parse_args()
+    options = {'streaming': args.streaming, 'workers': args.workers,
+               'lazy': args.lazy}
+
+    results = list()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ['PYNQ_COMPOSABLE_CACHE_DIR'] = os.path.join(tmpdir,
+                                                               'cache')
+        for static, depth, regions, rms in _scale_points:
+            directory = os.path.join(tmpdir, '{}_{}_{}_{}'.format(
+                static, depth, regions, rms))
+            os.makedirs(directory)
+            hwh = write_overlay(directory, static=static, regions=regions,
+                                rms=rms, depth=depth, chain=_chain)
+            point = {'static': static, 'depth': depth, 'regions': regions,
+                     'rms': rms, 'ports': static + regions,
+                     'hwh_size': os.path.getsize(hwh)}
+            for mode, cold in [('cold', True), ('warm', False)]:
+                point[mode] = measure(hwh, 'composable/axis_switch', cold,
+                                      options, args.repeat)
+            results.append(point)
+            print("ports {:3d} depth {:2d} rms {:4d}  cold {:7.3f} s  "
+                  "warm {:7.3f} s  peak {:7.2f} MiB  retained {:7.2f} MiB"
+                  .format(point['ports'], depth, regions * rms,
+                          point['cold']['time'], point['warm']['time'],
+                          point['cold']['peak'] / 2**20,
+                          point['cold']['retained'] / 2**20),
+                  file=sys.stderr)
+
+    report = {'commit': _commit(), 'python': platform.python_version(),
+              'streaming': args.streaming, 'lazy': args.lazy,
+              'repeat': args.repeat,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
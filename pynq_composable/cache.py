@@ -0,0 +1,249 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Discovery cache files
+
+A discovery cache is a single versioned JSON file, <basename>.json, with
+the digests, signatures, IP dictionaries, switch ports included, DFX
+regions and partial HWH results. It is replaced atomically, so a cache is
+either the old or the new one. Caches written with a different format
+version are ignored
+
+The cache files live in a central directory, PYNQ_COMPOSABLE_CACHE_DIR if
+set, otherwise $XDG_CACHE_HOME/pynq_composable or ~/.cache/pynq_composable.
+Its total size is capped to PYNQ_COMPOSABLE_CACHE_SIZE bytes, 64 MiB by
+default, evicting the least recently used caches first
+
+A cache can also ship with an overlay next to its HWH file, see
+local_path(). It is only read, if it is valid it is copied to the central
+directory
+"""
+
+from collections import namedtuple
+import glob
+import hashlib
+import json
+import os
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_SIZE = 64 << 20
+
+CacheInfo = namedtuple('CacheInfo', ['directory', 'hits', 'misses',
+                                     'maxsize', 'currsize', 'entries'])
+CacheEntry = namedtuple('CacheEntry', ['name', 'size', 'last_used'])
+
+_stats = {'hits': 0, 'misses': 0}
+
+
+def cache_dir() -> str:
+    """Return the directory where the cache files are stored"""
+
+    directory = os.environ.get('PYNQ_COMPOSABLE_CACHE_DIR')
+    if not directory:
+        xdg = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+        directory = os.path.join(xdg, 'pynq_composable')
+    return directory
+
+
+def cache_size() -> int:
+    """Return the maximum total size of the cache files in bytes"""
+
+    return int(os.environ.get('PYNQ_COMPOSABLE_CACHE_SIZE',
+                              DEFAULT_CACHE_SIZE))
+
+
+def cache_path(hwh_file: str, hier: str) -> str:
+    """Return the cache basename for a hierarchy of a HWH file
+
+    The absolute path of the HWH file is part of the name so overlays with
+    the same name in different directories do not collide
+
+    Parameters
+    ----------
+    hwh_file : str
+        global hwh file
+    hier : str
+        Hierarchy that contains the AXI4-Stream Switch
+    """
+
+    stem, key = _stem_key(hwh_file)
+    return os.path.join(cache_dir(), '{}_{}_{}'.format(
+        stem, hier.replace('/', '_'), key))
+
+
+def local_path(hwh_file: str, hier: str) -> str:
+    """Return the basename of the cache shipped next to a HWH file
+
+    The overlay Makefiles generate it at build time so it is part of the
+    overlay. It is never written at runtime
+
+    Parameters
+    ----------
+    hwh_file : str
+        global hwh file
+    hier : str
+        Hierarchy that contains the AXI4-Stream Switch
+    """
+
+    return os.path.splitext(hwh_file)[0] + '_' + hier.replace('/', '_')
+
+
+def _stem_key(hwh_file: str) -> tuple:
+    stem = os.path.splitext(os.path.basename(hwh_file))[0]
+    key = hashlib.md5(os.path.abspath(hwh_file).encode()).hexdigest()[:12]
+    return stem, key
+
+
+def find(hwh_file: str) -> list:
+    """Return the valid caches of every hierarchy of a HWH file
+
+    Parameters
+    ----------
+    hwh_file : str
+        global hwh file
+    """
+
+    stem, key = _stem_key(hwh_file)
+    pattern = os.path.join(glob.escape(cache_dir()),
+                           glob.escape(stem) + '_*_' + key + '.json')
+    caches = list()
+    for jsonfile in sorted(glob.glob(pattern)):
+        cached = load(os.path.splitext(jsonfile)[0])
+        if cached:
+            caches.append(cached)
+    return caches
+
+
+def record(hit: bool) -> None:
+    """Count a cache hit or miss"""
+
+    _stats['hits' if hit else 'misses'] += 1
+
+
+def _entries(directory: str) -> list:
+    """Return the cache entries in directory sorted by last use"""
+
+    entries = list()
+    for jsonfile in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            stat = os.stat(jsonfile)
+        except FileNotFoundError:
+            continue
+        entries.append(CacheEntry(os.path.splitext(jsonfile)[0],
+                                  stat.st_size, stat.st_mtime))
+    return sorted(entries, key=lambda e: e.last_used)
+
+
+def cache_info() -> CacheInfo:
+    """Return the cache directory, hits, misses, sizes and entries
+
+    Entries are sorted from least to most recently used
+    """
+
+    directory = cache_dir()
+    entries = _entries(directory)
+    return CacheInfo(directory, _stats['hits'], _stats['misses'],
+                     cache_size(), sum(e.size for e in entries), entries)
+
+
+def evict(keep: str = None) -> None:
+    """Remove least recently used caches until the size cap is met
+
+    Parameters
+    ----------
+    keep : str
+        Basename of a cache that must not be evicted
+    """
+
+    entries = _entries(cache_dir())
+    total = sum(e.size for e in entries)
+    for entry in entries:
+        if total <= cache_size():
+            break
+        if entry.name != keep:
+            remove(entry.name)
+            total -= entry.size
+
+
+def clear() -> None:
+    """Remove all cache files and reset the hit and miss counters"""
+
+    for entry in _entries(cache_dir()):
+        remove(entry.name)
+    _stats['hits'] = _stats['misses'] = 0
+
+
+def _replace(filename: str, write) -> None:
+    """Write a file atomically, write is called with the open file"""
+
+    tmpfile = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmpfile, 'wb') as file:
+        write(file)
+    os.replace(tmpfile, filename)
+
+
+def save(basename: str, payload: dict) -> None:
+    """Write the discovery results
+
+    Parameters
+    ----------
+    basename : str
+        Cache filename without extension
+    payload : dict
+        switch, switches, digest, signature, static_dict, default_dfx_dict,
+        regions and partials
+    """
+
+    document = dict(payload, version=CACHE_VERSION)
+    os.makedirs(os.path.dirname(basename), exist_ok=True)
+    _replace(basename + '.json',
+             lambda file: file.write(json.dumps(document).encode()))
+    evict(basename)
+
+
+def load(basename: str, touch: bool = True) -> dict:
+    """Read the discovery results
+
+    Returns None if the cache does not exist, is corrupt or was written with
+    a different format version. Reading a cache marks it as recently used
+
+    Parameters
+    ----------
+    basename : str
+        Cache filename without extension
+    touch : bool
+        Mark the cache as recently used
+    """
+
+    try:
+        with open(basename + '.json', 'rb') as file:
+            document = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(document, dict) or \
+            document.get('version') != CACHE_VERSION:
+        return None
+
+    del document['version']
+    if touch:
+        try:
+            os.utime(basename + '.json')
+        except OSError:
+            pass
+    return document
+
+
+def remove(basename: str) -> None:
+    """Remove the cache file"""
+
+    try:
+        os.remove(basename + '.json')
+    except FileNotFoundError:
+        pass
@@ -2,10 +2,13 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 
+from collections import namedtuple, OrderedDict
 from graphviz import Digraph
 import json
 import numpy as np
 import os
+import threading
+from .libs import get_resolution, set_resolution
 from .parser import HWHComposable
 from pynq import DefaultIP, DefaultHierarchy
 from pynq.utils import ReprDict
@@ -22,50 +25,68 @@ _mem_items = ['axis_register_slice', 'axis_data_fifo',
               'axis_subset_converter']
 
 
-def _nest_level(pl: list) -> int:
-    """Compute nested levels of a list iteratively"""
+def _find_index_in_list(pipeline: list, element: Type[DefaultIP]) \
+        -> Union[int, tuple]:
+    """Return the index of the element in the pipeline
 
-    if not isinstance(pl, list):
-        return 0
-    level = 0
-    for item in pl:
-        level = max(level, _nest_level(item))
+    The index is an int for elements in the top level of the pipeline and a
+    tuple with the index at every level for elements in a branch
+    """
 
-    return level + 1
+    for i, v in enumerate(pipeline):
+        if isinstance(v, list):
+            idx = _find_index_in_list(v, element)
+            if idx is not None:
+                return (i,) + (idx if isinstance(idx, tuple) else (idx,))
+        elif v == element:
+            return i
 
+    return None
 
-def _count_slots(pl: str) -> int:
-    """Returns the number of elements in a list"""
 
-    total = 0
-    for l0 in pl:
-        if isinstance(l0, list):
-            for l1 in l0:
-                if isinstance(l1, list):
-                    for l2 in l1:
-                        total += 1
-                else:
-                    total += 1
-        else:
-            total += 1
+def _pipeline_key(pl: list) -> tuple:
+    """Identity of a pipeline, nested tuples with the id of its elements"""
 
-    return total
+    return tuple(_pipeline_key(i) if isinstance(i, list) else id(i)
+                 for i in pl)
 
 
-def _find_index_in_list(pipeline: list, element: Type[DefaultIP]) \
-        -> Union[int, tuple]:
-    """Return the index of the element in the pipeline"""
+_Plan = namedtuple('_Plan', ['switch_conf', 'flat_list', 'start', 'links',
+                             'edges', 'dfx_nodes'])
+_plan_cache_size = 64
 
-    for i, v in enumerate(pipeline):
-        if isinstance(v, list):
-            for ii, vv in enumerate(v):
-                for iii, vvv in enumerate(vv):
-                    if vvv == element:
-                        return i, ii, iii
-        elif v == element:
-            return i
+PipelinePlan = namedtuple('PipelinePlan', ['switch_conf', 'start', 'free_ci',
+                                           'free_pi', 'errors'])
+PipelinePlan.__doc__ = """Result of Composable.plan
+
+switch_conf (numpy array) configuration compose writes to the switch
+start (tuple) IP objects with a start method, in order, compose only
+    starts the ones that are new, moved or reconfigured
+free_ci (tuple) switch ports, ci, not routed by the pipeline
+free_pi (tuple) switch ports, pi, not routed by the pipeline
+errors (tuple) exceptions that make the pipeline invalid
+"""
+
+_Route = namedtuple('_Route', ['switch_conf', 'flat_list', 'edges', 'links',
+                               'ci', 'pi'])
 
-    return None
+
+def _plan_graph(plan: _Plan, debug: bool, rankdir: str) -> Digraph:
+    """Build the Graphviz Digraph of a compiled plan, None is an empty one"""
+
+    graph = Digraph(
+        node_attr={'shape': 'box'},
+        edge_attr={'color': 'green'},
+        graph_attr={'rankdir': rankdir}
+        )
+    if plan is None:
+        return graph
+    for tail, head, ci, pi in plan.edges:
+        graph.edge(tail, head, label=_edge_label(ci, pi, debug))
+    for key in plan.dfx_nodes:
+        graph.node(key, _attributes={"color": "blue", "fillcolor": "cyan",
+                                     "style": "filled"})
+    return graph
 
 
 def _edge_label(ci: int, pi: int, debug: bool) -> str:
@@ -75,6 +96,13 @@ def _edge_label(ci: int, pi: int, debug: bool) -> str:
            'ci=' + str(ci) + ' pi=' + str(pi) + '</font>>'
 
 
+def _routing(conf: np.ndarray) -> np.ndarray:
+    """Return a switch configuration with every disabled MI port as -1"""
+
+    conf = np.asarray(conf, dtype=np.int64)
+    return np.where((conf < 0) | (conf >= 1 << 31), -1, conf)
+
+
 def _get_ip_name_by_vlnv(description: str, vlnv: str) -> str:
     """Search IP by its VLNV and return its name"""
 
@@ -118,8 +146,26 @@ class Composable(DefaultHierarchy):
     ----------
     graph : Digraph
         Graphviz Digraph representation of the current dataflow pipeline
+    lazy : bool
+        Class attribute, set it to True before loading the overlay to only
+        parse the partial HWH files of a DFX region when one of its IP is
+        first used. Partial HWH files already in the discovery cache are
+        always available
+    reset_policy : str
+        When compose pulses the pipeline soft reset. 'routing', the default,
+        only when the switch configuration changes, 'always' on every
+        compose. The soft reset is global to the hierarchy, hence every IP
+        is started again after it. 'edits' is 'routing' for compose, but
+        replace, insert and remove do not pulse the soft reset, they only
+        write the switch registers that change and only start the IP that
+        are new, connected to different switch ports or reconfigured. IP
+        removed from the pipeline are not flushed, use it only if the IP
+        in the pipeline tolerate being rerouted mid-frame
     """
 
+    lazy = False
+    reset_policy = 'routing'
+
     @staticmethod
     def checkhierarchy(description):
         if _get_ip_name_by_vlnv(description, 'xilinx.com:ip:axis_switch:1.1'):
@@ -184,19 +230,30 @@ class Composable(DefaultHierarchy):
             self._soft_reset = None
             self._dfx_control = None
 
-        parser = HWHComposable(self._hwh_name, self.axis_switch._fullpath)
-        self._c_dict = parser.c_dict
-        self._dfx_dict = parser.dfx_dict
+        self._parser = HWHComposable(self._hwh_name,
+                                     self.axis_switch._fullpath,
+                                     lazy=self.lazy)
+        self._c_dict = self._parser.c_dict
+        self._dfx_dict = self._parser.dfx_dict
 
         self._paths = dict()
         self._default_paths()
-        self._switch.pi = self._sw_default
+        self._init_state()
+        self._switch.pi = np.copy(self._sw_default)
+
+    def _init_state(self) -> None:
+        """Initialize the pipeline, plan and graph state"""
 
-        self.graph = Digraph()
-        self.graph.graph_attr['rankdir'] = 'LR'
+        self._rankdir = 'LR'
         self._graph_debug = False
+        self._graph = None
+        self._graph_key = None
+        self._plan = None
         self._current_pipeline = None
         self._current_flat_pipeline = None
+        self._plans = OrderedDict()
+        self._plans_lock = threading.Lock()
+        self._running = dict()
 
     @property
     def dfx_dict(self) -> dict:
@@ -209,6 +266,7 @@ class Composable(DefaultHierarchy):
         ip': dict}}.
         """
 
+        self._resolve()
         return ReprDict(self._dfx_dict, rootname='dfx_dict')
 
     @property
@@ -222,9 +280,86 @@ class Composable(DefaultHierarchy):
         'dfx': bool, 'loaded': bool, 'bitstream: str'}}.
         """
 
+        self._resolve()
         return ReprDictComposable(self._c_dict,
                                   rootname=self._hier.replace('/', ''))
 
+    def _resolve(self, region: str = None) -> None:
+        """Add the IP of DFX regions that are pending in lazy mode
+
+        Parameters
+        ----------
+        region : str
+            DFX region name, all the pending regions are resolved if None
+        """
+
+        if not self._parser.pending:
+            return
+        self._merge_dfx_ip(self._parser.resolve(region))
+
+    def _resolve_key(self, key: str) -> None:
+        """Resolve the DFX region a c_dict key belongs to"""
+
+        for region in self._parser.pending:
+            if key.startswith(region + '/'):
+                self._resolve(region)
+                return
+
+    def _merge_dfx_ip(self, iplist: list) -> None:
+        """Copy DFX IP from the parser c_dict keeping their loaded state"""
+
+        if iplist:
+            with self._plans_lock:
+                self._plans.clear()
+        for ip in iplist:
+            entry = dict(self._parser.c_dict[ip])
+            if ip in self._c_dict:
+                entry['loaded'] = self._c_dict[ip]['loaded']
+            self._c_dict[ip] = entry
+
+    @property
+    def graph(self) -> Digraph:
+        """Graphviz Digraph representation of the current dataflow pipeline
+
+        The Digraph is built on first access and kept until a different
+        pipeline is composed or _graph_debug changes. Its rankdir is kept
+        for the next Digraph
+        """
+
+        if self._graph is None or self._graph_key[0] is not self._plan or \
+                self._graph_key[1] != self._graph_debug:
+            if self._graph is not None:
+                self._rankdir = self._graph.graph_attr['rankdir']
+            self._graph = _plan_graph(self._plan, self._graph_debug,
+                                      self._rankdir)
+            self._graph_key = (self._plan, self._graph_debug)
+        return self._graph
+
+    @property
+    def resolution(self) -> tuple:
+        """Image resolution, (width, height), of the IP in this hierarchy
+
+        Setting it registers the resolution for this hierarchy only and
+        writes it to the IP of the current pipeline that take one, they are
+        not restarted
+        """
+
+        return get_resolution(self._hier.rstrip('/'))
+
+    @resolution.setter
+    def resolution(self, resolution: tuple) -> None:
+        width, height = resolution
+        set_resolution(width, height, self._hier.rstrip('/'))
+        if self._plan is None:
+            return
+
+        for ip, links in zip(self._plan.start, self._plan.links):
+            if not hasattr(ip, '_resolution'):
+                continue
+            ip.cols, ip.rows = int(width), int(height)
+            if id(ip) in self._running:
+                self._running[id(ip)] = (links, ip._fingerprint())
+
     @property
     def current_pipeline(self) -> list:
         """List of IP objects in the current dataflow pipeline"""
@@ -310,6 +445,8 @@ class Composable(DefaultHierarchy):
         """
 
         self._ol.pr_download(self._hier + partial_region, partial_bit)
+        self._switch.invalidate()
+        self._running.clear()
         self._unload_region_from_ip_dict(partial_region)
         dfx_dict = \
             self._dfx_dict[partial_region]['rm'][os.path.basename(partial_bit)]
@@ -319,7 +456,7 @@ class Composable(DefaultHierarchy):
         """Unset loaded attribute for all of the IP of provided region"""
 
         for k in self._c_dict.keys():
-            if partial_region in k:
+            if k.startswith(partial_region + '/'):
                 self._c_dict[k]['loaded'] = False
 
     def _set_loaded(self, dfx_dict: dict) -> None:
@@ -335,6 +472,7 @@ class Composable(DefaultHierarchy):
         """
 
         fullpath = fullpath.replace(self._hier, '')
+        self._resolve_key(fullpath)
         if fullpath not in self._default_ip.keys():
             return fullpath
 
@@ -345,6 +483,10 @@ class Composable(DefaultHierarchy):
     def compose(self, cle_list: list) -> None:
         """Configure design to implement required dataflow pipeline
 
+        The pipeline is compiled into a plan that is cached, composing a
+        pipeline with the same IP objects in the same layout again only
+        configures the hardware
+
         Parameters
         ----------
         cle_list : list
@@ -365,146 +507,243 @@ class Composable(DefaultHierarchy):
                     -> a -> b               f -> g ->
                               \\            /
                                 ---> e ----
+
+            A branch is a pipeline itself, so it can hold other branches
+            as long as the switch has enough ports
+        """
+
+        self._compose(cle_list)
+
+    def _compose(self, cle_list: list, reset: bool = None) -> None:
+        """Compile and apply a pipeline and make it the current one"""
+
+        plan = self._compile(cle_list)
+        self._apply(plan, reset)
+        self._current_pipeline = cle_list
+        self._current_flat_pipeline = list(plan.flat_list)
+
+    def _edit(self, pipeline: list) -> None:
+        """Apply an edit of the current pipeline
+
+        Under the 'edits' reset_policy the soft reset is not pulsed, the
+        new plan is diffed against the running one instead
+        """
+
+        self._compose(pipeline,
+                      False if self.reset_policy == 'edits' else None)
+
+    def plan(self, cle_list: list) -> PipelinePlan:
+        """Validate a pipeline without configuring the hardware
+
+        Returns the switch configuration, the IP objects with a start
+        method, in order, and the switch ports left free in each direction.
+        compose only starts the ones that are new, connected to different
+        switch ports or reconfigured. Errors are returned instead of raised,
+        in that case the switch configuration is None. The plan is cached
+        and reused by compose, plan can be called from another thread
+
+        Parameters
+        ----------
+        cle_list : list
+            list of the composable IP objects, see compose
+        """
+
+        try:
+            plan = self._compile(cle_list)
+        except (AttributeError, KeyError, SystemError, TypeError,
+                ValueError) as err:
+            return PipelinePlan(None, tuple(), None, None, (err,))
+
+        switch_conf = self._switch_vector(plan.switch_conf)
+        switch_conf.flags.writeable = False
+        vector = switch_conf.tolist()
+        used = set(vector)
+        free_ci = tuple(p for p in range(self._max_slots) if p not in used)
+        free_pi = tuple(p for p, v in enumerate(vector) if v < 0)
+        return PipelinePlan(switch_conf, plan.start, free_ci, free_pi,
+                            tuple())
+
+    def _compile(self, cle_list: list) -> _Plan:
+        """Validate a pipeline and return its plan
+
+        Plans are cached by the identity of the IP objects in the pipeline
+        and its layout. The cache keeps a reference to the IP objects, so
+        their identity cannot be reused while cached. The cache is guarded
+        by a lock, so plans can be compiled from another thread
         """
 
         if not isinstance(cle_list, list):
             raise TypeError("The composable pipeline must be a list")
 
-        levels = _nest_level(cle_list)
+        plan_key = _pipeline_key(cle_list)
+        with self._plans_lock:
+            if (plan := self._plans.get(plan_key)) is not None:
+                self._plans.move_to_end(plan_key)
+                return plan
 
-        if levels > 3:
-            raise SystemError("Data flow pipeline with a nest levels bigger "
-                              "than 3 is not supported. {}".format(levels))
-        elif levels % 2 == 0:
-            raise SystemError("Data flow pipeline with an even nest"
-                              " levels is not supported. {}".format(levels))
+        route = _Route(np.ones(self._max_slots, dtype=np.int64) * -1,
+                       list(), list(), dict(), set(), set())
+        self._route(cle_list, list(), route, False)
+        flat_list, switch_conf = route.flat_list, route.switch_conf
 
-        slots = _count_slots(cle_list)
-        if slots > self._max_slots:
+        if len(flat_list) > self._max_slots:
             raise SystemError("Number of slots in the list is bigger than {} "
                               "which are the max slots that hardware allows"
                               .format(self._max_slots))
 
-        switch_conf = np.ones(self._max_slots, dtype=np.int64) * -1
-
-        flat_list = list()
-        graph = Digraph(
-            node_attr={'shape': 'box'},
-            edge_attr={'color': 'green'},
-            graph_attr={'rankdir': self.graph.graph_attr['rankdir']}
-            )
-        gdebug = self._graph_debug
-        for i, l0 in enumerate(cle_list):
-            if isinstance(l0, list):
-                key = self._relative_path(cle_list[i+1]._fullpath)
-                next_node = self._c_dict[key]
-                if len(l0) != len(next_node['pi']):
-                    raise SystemError("Node {} has {} input(s) and cannot meet"
-                                      "pipeline requirement of {} input(s)"
-                                      .format(key, len(next_node['pi']),
-                                              len(l0)))
-                for ii, l1 in enumerate(l0):
-                    if not isinstance(l1, list):
-                        raise SystemError("Branches must be represented as "
-                                          "list of list")
-                    for iii, l2 in enumerate(l1):
-                        ip = cle_list[i][ii][iii]
-                        if ip == 1:
-                            continue
-                        flat_list.append(ip)
-                        ci = self._c_dict[
-                            self._relative_path(ip._fullpath)]['ci'][0]
-                        if iii == len(l1) - 1:
-                            consumer = key
-                            pi = self._c_dict[consumer]['pi'][ii]
-                        else:
-                            consumer = self._relative_path(
-                                cle_list[i][ii][iii+1]._fullpath)
-                            pi = self._c_dict[consumer]['pi'][0]
-
-                        if not np.where(switch_conf == ci)[0].size:
-                            switch_conf[pi] = ci
-                            graph.edge(self._relative_path(ip._fullpath),
-                                       consumer,
-                                       label=_edge_label(ci, pi, gdebug))
-                        else:
-                            raise SystemError("IP: {} is already being used in"
-                                              " the provided pipeline. An IP "
-                                              "instance can only be used once"
-                                              .format(ip._fullpath))
-            else:
-                ip = cle_list[i]
-                flat_list.append(ip)
-                if i == len(cle_list) - 1:
-                    break
-                ci = self._c_dict[(path := self._relative_path(ip._fullpath,
-                                                               'ci'))]['ci']
-                if not isinstance(cle_list[i+1], list):
-                    pi = self._c_dict[(key :=
-                                      self._relative_path(
-                                        cle_list[i+1]._fullpath, 'pi'))]['pi']
-
-                    if not np.where(switch_conf == ci[0])[0].size:
-                        switch_conf[pi[0]] = ci[0]
-                        graph.edge(path, key,
-                                   label=_edge_label(ci[0], pi[0], gdebug))
-                    else:
-                        raise SystemError("IP: {} is already being used in the"
-                                          " provided pipeline. An IP instance "
-                                          "can only be used once"
-                                          .format(ip._fullpath))
-
-                elif len(cle_list[i+1]) != len(ci):
-                    raise SystemError("Node {} has {} output(s) and cannot "
-                                      "meet pipeline requirement of {} "
-                                      "output(s)".format(l0._fullpath, len(ci),
-                                                         len(cle_list[i+1])))
-                else:
-                    for j in range(len(ci)):
-                        nextip = cle_list[i+1][j][0]
-                        if nextip != 1:
-                            nextkey = self._relative_path(nextip._fullpath)
-                            pi = self._c_dict[nextkey]['pi'][0]
-                        else:
-                            nextip = cle_list[i+2]
-                            nextkey = self._relative_path(nextip._fullpath)
-                            pi = self._c_dict[nextkey]['pi'][j]
-
-                        if not np.where(switch_conf == ci[j])[0].size:
-                            switch_conf[pi] = ci[j]
-                            graph.edge(self._relative_path(ip._fullpath),
-                                       self._relative_path(nextip._fullpath),
-                                       label=_edge_label(ci[j], pi, gdebug))
-                        else:
-                            raise SystemError("IP: {} is already being used "
-                                              "in the provided pipeline. An IP"
-                                              " instance can only be used once"
-                                              .format(ip._fullpath))
-
-        if self._soft_reset:
-            self._soft_reset[0].write(1)
-            self._soft_reset[0].write(0)
-
-        self._configure_switch(switch_conf)
-
+        dfx_nodes = list()
+        start = list()
         for idx, ip in enumerate(flat_list):
             port = 'pi' if idx == len(flat_list)-1 else 'ci'
             key = self._relative_path(ip._fullpath, port)
             if self._c_dict[key]["dfx"]:
-                graph.node(key,
-                           _attributes={"color": "blue", "fillcolor": "cyan",
-                                        "style": "filled"})
-            if not isinstance(ip, UnloadedIP):
-                if hasattr(ip, "start"):
-                    ip.start()
-            else:
+                dfx_nodes.append(key)
+            if isinstance(ip, UnloadedIP):
                 raise AttributeError("IP {} is not loaded, load IP before "
                                      "composing a pipeline"
                                      .format(ip._fullpath))
+            elif hasattr(ip, "start"):
+                start.append(ip)
+
+        switch_conf.flags.writeable = False
+        links = tuple(tuple(route.links.get(id(ip), list())) for ip in start)
+        plan = _Plan(switch_conf, tuple(flat_list), tuple(start), links,
+                     tuple(route.edges), tuple(dfx_nodes))
+        with self._plans_lock:
+            self._plans[plan_key] = plan
+            if len(self._plans) > _plan_cache_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def _route(self, pipeline: list, sources: list, route: _Route,
+               following: bool) -> list:
+        """Route a pipeline, or a branch of it, through the switch
+
+        Each element is visited once and the switch ports in use are kept in
+        sets, so routing is linear in the number of connections. Branches
+        are routed recursively, hence they can be nested at any depth
 
-        self._current_pipeline = cle_list
-        self._current_flat_pipeline = flat_list
-        self.graph = graph
+        Parameters
+        ----------
+        pipeline : list
+            Pipeline or branch to route
+        sources : list
+            Producers, (ip, key, ci), that feed the first element
+        route : _Route
+            Routing state, updated in place
+        following : bool
+            There are elements after this pipeline
+
+        Returns the producers at the end of the pipeline
+        """
+
+        previous = None
+        for i, item in enumerate(pipeline):
+            last = i == len(pipeline) - 1
+            if isinstance(item, list):
+                if sources and len(sources) != len(item):
+                    raise SystemError("Node {} has {} output(s) and cannot "
+                                      "meet pipeline requirement of {} "
+                                      "output(s)"
+                                      .format(sources[0][0]._fullpath,
+                                              len(sources), len(item)))
+                tails = list()
+                for j, branch in enumerate(item):
+                    if not isinstance(branch, list):
+                        raise SystemError("Branches must be represented as "
+                                          "list of list")
+                    tails += self._route(branch, sources[j:j+1], route,
+                                         following or not last)
+                sources = tails
+            elif isinstance(item, int) and item == 1:
+                continue
+            else:
+                if sources:
+                    key = self._relative_path(item._fullpath, 'pi')
+                    pi = self._c_dict[key]['pi']
+                    if len(sources) > len(pi) or (isinstance(previous, list)
+                                                  and len(sources) != len(pi)):
+                        raise SystemError("Node {} has {} input(s) and cannot "
+                                          "meet pipeline requirement of {} "
+                                          "input(s)".format(key, len(pi),
+                                                            len(sources)))
+                    for source, port in zip(sources, pi):
+                        self._connect(source, (item, key, port), route)
+                route.flat_list.append(item)
+                if last and not following:
+                    return list()
+                key = self._relative_path(item._fullpath, 'ci')
+                ci = self._c_dict[key]['ci']
+                if last or not isinstance(pipeline[i+1], list):
+                    ci = ci[:1]
+                sources = [(item, key, port) for port in ci]
+            previous = item
+
+        return sources
+
+    @staticmethod
+    def _connect(source: tuple, sink: tuple, route: _Route) -> None:
+        """Route a producer, (ip, key, ci), to a consumer, (ip, key, pi)"""
+
+        for (ip, _, port), used in [(source, route.ci), (sink, route.pi)]:
+            if port in used:
+                raise SystemError("IP: {} is already being used in the "
+                                  "provided pipeline. An IP instance can only "
+                                  "be used once".format(ip._fullpath))
+            used.add(port)
+        route.switch_conf[sink[2]] = source[2]
+        for ip, _, _ in [source, sink]:
+            route.links.setdefault(id(ip), list()).append((source[2],
+                                                           sink[2]))
+        route.edges.append((source[1], sink[1], source[2], sink[2]))
+
+    def _apply(self, plan: _Plan, reset: bool = None) -> None:
+        """Configure the hardware and start the IP of a compiled plan
+
+        An IP that was started by a previous compose is only started again
+        if it is connected to different switch ports or its fingerprint, the
+        configuration its start method writes, changed. The fingerprint is
+        taken after start, so state that start changes, like the auto
+        restart bit of a stopped IP, is part of it. IP without a
+        fingerprint are always started. The soft reset restarts all of them
+        and it is skipped if the switch configuration does not change,
+        unless reset_policy is 'always'. If reset is not None, it decides
+        whether the soft reset is pulsed instead. The configuration is
+        compared with the one the switch driver reports, so routes changed
+        through another driver are detected
+        """
+
+        if self.reset_policy not in ['routing', 'always', 'edits']:
+            raise ValueError("reset_policy must be 'routing', 'always' or "
+                             "'edits', not {}".format(self.reset_policy))
+
+        switch_conf = self._switch_vector(plan.switch_conf)
+        rerouted = not np.array_equal(_routing(switch_conf),
+                                      _routing(self._switch.pi))
+
+        if reset is None:
+            reset = rerouted or self.reset_policy == 'always'
+        if self._soft_reset and reset:
+            self._soft_reset[0].write(1)
+            self._soft_reset[0].write(0)
+            self._running.clear()
+
+        if rerouted:
+            self._switch.pi = np.copy(switch_conf)
+
+        running = dict()
+        for ip, links in zip(plan.start, plan.links):
+            if not hasattr(ip, '_fingerprint'):
+                ip.start()
+                continue
+            state = (links, ip._fingerprint())
+            if state[1] is None or self._running.get(id(ip)) != state:
+                ip.start()
+                state = (links, ip._fingerprint())
+            running[id(ip)] = state
+        self._running = running
+
+        self._plan = plan
 
     def loadIP(self, dfx_list: list) -> None:
         """Download dfx IP onto the corresponding partial regions
@@ -525,23 +764,24 @@ class Composable(DefaultHierarchy):
         for ip in dfx_list:
             if isinstance(ip, str):
                 fullpath = ip
+                self._resolve_key(fullpath)
             else:
                 fullpath = self._relative_path(ip._fullpath)
 
             bitname = os.path.basename(self._c_dict[fullpath]['bitstream'])
-            for pr in self._dfx_dict:
-                if pr in bitname:
-                    if pr not in bit_dict.keys():
-                        bit_dict[pr] = dict()
-                        bit_dict[pr]['bitstream'] = bitname
-                        bit_dict[pr]['loaded'] = \
-                            self._c_dict[fullpath]['loaded']
-                    elif bit_dict[pr]['bitstream'] != bitname:
-                        raise SystemError("\'{}\' and \'{}\' bitstreams cannot"
-                                          " be loaded into the same DFX "
-                                          " region \'{}\' at the same time"
-                                          .format(bit_dict[pr]['bitstream'],
-                                                  bitname, pr))
+            pr = self._parser.partial_region(bitname)
+            if pr is None:
+                continue
+            if pr not in bit_dict.keys():
+                bit_dict[pr] = dict()
+                bit_dict[pr]['bitstream'] = bitname
+                bit_dict[pr]['loaded'] = self._c_dict[fullpath]['loaded']
+            elif bit_dict[pr]['bitstream'] != bitname:
+                raise SystemError("\'{}\' and \'{}\' bitstreams cannot be "
+                                  "loaded into the same DFX region \'{}\' "
+                                  "at the same time"
+                                  .format(bit_dict[pr]['bitstream'],
+                                          bitname, pr))
 
         path = os.path.dirname(self._bitfile) + '/'
         for pr in bit_dict:
@@ -563,6 +803,31 @@ class Composable(DefaultHierarchy):
                 if self._dfx_control and decoupler:
                     decoupler.write(0)
 
+    def register_rm(self, region: str, bitfile: str) -> None:
+        """Make a new reconfigurable module available in a DFX region
+
+        Only the partial HWH file of the reconfigurable module is parsed, its
+        IP are added to the c_dict and dfx_dict and the discovery cache is
+        updated. The hardware and the current pipeline are not modified
+
+        Parameters
+        ----------
+        region : str
+            DFX region name
+        bitfile : str
+            Partial bitstream, it must be next to the bitstream that was used
+            to create the Overlay object and follow the naming convention
+            <bitstream_name>_<hierarchy>_<pr_region>_<pr_module_name>.bit
+
+            Examples:
+                register_rm('pr_0', 'cv_dfx_4_pr_composable_pr_0_new.bit')
+        """
+
+        dfx_dict = self._parser.register_rm(region, bitfile)
+        self._dfx_dict[region].setdefault('rm', dict())[
+            os.path.basename(bitfile)] = dfx_dict
+        self._merge_dfx_ip(list(dfx_dict))
+
     def remove(self, iplist: list = None) -> None:
         """Remove IP object from the current pipeline
 
@@ -591,7 +856,7 @@ class Composable(DefaultHierarchy):
 
             pipeline.remove(ip)
 
-        self.compose(pipeline)
+        self._edit(pipeline)
 
     def insert(self, iptuple: tuple) -> None:
         """Insert a new IP or list of IP into current pipeline
@@ -626,7 +891,7 @@ class Composable(DefaultHierarchy):
         pipeline = self._current_pipeline[:iptuple[1]] + newlist + \
             self._current_pipeline[iptuple[1]:]
 
-        self.compose(pipeline)
+        self._edit(pipeline)
 
     def replace(self, replaceip: tuple) -> None:
         """Replace an IP object in the current pipeline
@@ -653,12 +918,15 @@ class Composable(DefaultHierarchy):
         if isinstance(idx, int):
             pipeline[idx] = replaceip[1]
         elif isinstance(idx, tuple):
-            pipeline[idx[0]][idx[1]][idx[2]] = replaceip[1]
+            branch = pipeline
+            for i in idx[:-1]:
+                branch = branch[i]
+            branch[idx[-1]] = replaceip[1]
         else:
             raise ValueError("IP {} is not in the current pipeline"
                              .format(replaceip[0]._fullpath))
 
-        self.compose(pipeline)
+        self._edit(pipeline)
 
     def tap(self, ip: Union[Type[DefaultIP], int] = None) -> None:
         """Observe the output of an IP object in the current pipeline
@@ -743,22 +1011,24 @@ class Composable(DefaultHierarchy):
             return attr
 
     def __dir__(self):
+        self._resolve()
         return sorted(set(super().__dir__() +
                           list(self.__dict__.keys()) +
                           list(self._c_dict.keys()) +
                           list(self._default_ip.keys())))
 
-    def _configure_switch(self, new_sw_config: dict) -> None:
-        """Verify that default values are set and configure the switch"""
+    def _switch_vector(self, new_sw_config: np.ndarray) -> np.ndarray:
+        """Return the switch configuration with the default values set"""
 
-        switch_conf = np.copy(new_sw_config)
+        switch_conf = new_sw_config.tolist()
+        used = set(switch_conf)
 
-        for idx, val in enumerate(switch_conf):
-            if val < 0 and self._sw_default[idx] > 0 and \
-                    self._sw_default[idx] not in switch_conf:
-                switch_conf[idx] = self._sw_default[idx]
+        for idx, default in enumerate(self._sw_default.tolist()):
+            if switch_conf[idx] < 0 and default > 0 and default not in used:
+                switch_conf[idx] = default
+                used.add(default)
 
-        self._switch.pi = switch_conf
+        return np.array(switch_conf, dtype=np.int64)
 
 
 class DFXRegion:
@@ -769,6 +1039,7 @@ class DFXRegion:
         self._parent = cpipe._hier
         self._c_dict = cpipe._c_dict
         self.key = name
+        cpipe._resolve_key(name + '/')
 
     def __getattr__(self, name: str):
         key = self.key + '/' + name
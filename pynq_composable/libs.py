@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 from enum import Enum
+from functools import lru_cache
 import numpy as np
 import json
 import os
@@ -27,6 +28,65 @@ else:
     _cols = 1280
     _rows = 720
 
+_resolutions = dict()
+_resolution_file = "/tmp/resolution.json"
+
+
+def set_resolution(width: int, height: int, hierarchy: str = None) -> None:
+    """Register the image resolution the Vitis Vision IP are started with
+
+    Parameters
+    ----------
+    width : int
+        Image width
+    height : int
+        Image height
+    hierarchy : str
+        Hierarchy the resolution applies to, all hierarchies if None
+    """
+
+    _resolutions[hierarchy] = (int(width), int(height))
+
+
+def clear_resolution(hierarchy: str = None) -> None:
+    """Remove the image resolution registered for a hierarchy"""
+
+    _resolutions.pop(hierarchy, None)
+
+
+def get_resolution(path: str) -> tuple:
+    """Return the image resolution, (width, height), for an IP or hierarchy
+
+    The resolution registered for the innermost hierarchy that contains path
+    is returned, otherwise the one registered for all hierarchies. If there
+    is none, the resolution is read from /tmp/resolution.json, if it exists,
+    for compatibility with previous versions. The file is only read once
+
+    Parameters
+    ----------
+    path : str
+        Full path of the IP or hierarchy
+    """
+
+    while path:
+        if (resolution := _resolutions.get(path)) is not None:
+            return resolution
+        path = path.rpartition('/')[0]
+    if (resolution := _resolutions.get(None)) is not None:
+        return resolution
+    return _read_resolution_file(_resolution_file) or (_cols, _rows)
+
+
+@lru_cache(maxsize=1)
+def _read_resolution_file(filename: str) -> tuple:
+    """Return the resolution in a resolution file, None if it is missing"""
+
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "r", encoding='utf8') as f:
+        reso = json.load(f)
+        return reso["width"], reso["height"]
+
 
 class VitisVisionIP(DefaultIP):
     """Generic Driver for Vitis Vision IP cores"""
@@ -55,15 +115,24 @@ class VitisVisionIP(DefaultIP):
     def __init__(self, description):
         super().__init__(description=description)
 
+    def _resolution(self) -> tuple:
+        """Return the image resolution, (cols, rows), used by start"""
+        return get_resolution(self._fullpath)
+
+    def _fingerprint(self) -> tuple:
+        """Return the configuration written by start
+
+        Composable only restarts an IP already running in the same place
+        of the pipeline if its fingerprint changes. The auto restart bit and
+        the rows and cols written to the IP are part of it, so an IP that
+        was stopped or whose rows or cols were set directly is restarted
+        """
+        return (self.read(0x00) & 0x80, getattr(self, '_cols', None),
+                getattr(self, '_rows', None)) + self._resolution()
+
     def start(self):
         """Populate the image resolution and start the IP"""
-        file = "/tmp/resolution.json"
-        if os.path.exists(file):
-            with open(file, "r", encoding='utf8') as f:
-                reso = json.load(f)
-                self._cols, self._rows = reso["width"], reso["height"]
-        else:
-            self._cols, self._rows = _cols, _rows
+        self._cols, self._rows = self._resolution()
         self.write(self._rows_offset, int(self._rows))
         self.write(self._cols_offset, int(self._cols))
         self.write(0x00, 0x81)
@@ -263,6 +332,9 @@ class Filter2d(VitisVisionIP):
 
         self.write(0x20, int(self._shift))
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self._kernel.tobytes(), self._shift)
+
     def start(self):
         super().start()
         self._populateKernel()
@@ -286,6 +358,9 @@ class GaussianBlur(VitisVisionIP):
         super().__init__(description=description)
         self.sigma = 1.0
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self.sigma,)
+
     def start(self):
         super().start()
         if self.sigma < 0.27:
@@ -340,6 +415,10 @@ class colorThreshold(VitisVisionIP):
                 self.write(0x60 + (i // 4) * 4, int(aux))
                 aux = 0
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self._lower_thr.tobytes(),
+                                         self._upper_thr.tobytes())
+
     def start(self):
         super().start()
         self._populateThreshold()
@@ -411,6 +490,10 @@ class inRange(VitisVisionIP):
                 self.write(0x30 + (i // 4) * 4, int(aux))
                 aux = 0
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self.lower_thr.tobytes(),
+                                         self.upper_thr.tobytes())
+
     def start(self):
         super().start()
         self.populateThreshold()
@@ -440,6 +523,9 @@ class Morphological(VitisVisionIP):
                 self.write(0x40 + ((i // 4) * 4), int(aux))
                 aux = 0
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self.kernel.tobytes(),)
+
     def start(self):
         super().start()
         self.populateKernel()
@@ -469,6 +555,9 @@ class Fast(VitisVisionIP):
         self._threshold = threshold
         self.write(0x20, int(self._threshold))
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self._threshold,)
+
     def start(self):
         super().start()
         self.write(0x20, int(self._threshold))
@@ -521,6 +610,9 @@ class CornerHarris(VitisVisionIP):
         self._k = _convert_to_q0_16(k)
         self.write(0x28, int(self._k))
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self._threshold, self._k)
+
     def start(self):
         super().start()
         self.write(0x20, int(self._threshold))
@@ -664,6 +756,9 @@ class PixelLut(VitisVisionIP):
                 self.write(0x400 + ((i // 4) * 4), int(aux))
                 aux = 0
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self._lut.tobytes(),)
+
     def start(self):
         super().start()
         self._populateLUT()
@@ -694,6 +789,9 @@ class MultiplyIP(VitisVisionIP):
         super().__init__(description=description)
         self._scale = 1.0
 
+    def _fingerprint(self) -> tuple:
+        return super()._fingerprint() + (self._scale,)
+
     def start(self):
         super().start()
         self.write(0x20, _float2int(self.scale))
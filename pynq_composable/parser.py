@@ -3,13 +3,22 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union
 import re
 import os
 import glob
 import hashlib
-import pickle as pkl
 import argparse
+import threading
+import time
+import warnings
+
+if __name__ == "__main__" and not __package__:
+    # Run as a script by the boards/*/Makefile dict targets
+    import cache as _cache
+else:
+    from . import cache as _cache
 
 __author__ = "Mario Ruiz"
 __copyright__ = "Copyright 2021, Xilinx"
@@ -24,6 +33,15 @@ _mem_items = ['axis_register_slice', 'axis_data_fifo', 'fifo_generator',
 _dfx_item = ['dfx_decoupler']
 _axis_vlnv = 'xilinx.com:interface:axis:1.0'
 
+_stream_chunk = 1 << 20
+_stream_attributes = {
+    'MODULE': ('FULLNAME', 'MODTYPE', 'VLNV'),
+    'BUSINTERFACE': ('BUSNAME', 'NAME', 'TYPE', 'VLNV'),
+    'PORT': ('NAME', 'SIGNAME'),
+    'PARAMETER': ('NAME', 'VALUE')
+}
+_stream_parameters = ['DIN_FROM', 'DIN_TO']
+
 
 def _normalize_type(i_type: str) -> str:
     """Normalize AXI4-Stream names"""
@@ -38,28 +56,214 @@ def _normalize_type(i_type: str) -> str:
     return i_type
 
 
-def _find_connected_node(slot: dict, tree: ElementTree) -> tuple:
+def _file_signature(filename: str) -> list:
+    """Return size, modification time and inode of a file"""
+
+    st = os.stat(filename)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def _file_digest(filename: str) -> str:
+    """Compute the md5 digest of a file reading it in chunks"""
+
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(_stream_chunk), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class _ConnectivityIndex:
+    """Lookup tables for the MODULES section of a HWH file
+
+    The tables are built with a single pass over the modules. FULLNAME maps
+    to the MODULE element, BUSNAME maps to the (MODULE, BUSINTERFACE) pairs
+    that use that bus and SIGNAME maps to the (MODULE, PORT) pairs that use
+    that signal, in document order. Only the first BUSINTERFACE or PORT of a
+    module is recorded for a given BUSNAME or SIGNAME
+    """
+
+    def __init__(self, tree: ElementTree.ElementTree):
+        self._modules = dict()
+        self._busnames = dict()
+        self._signames = dict()
+        for mod in tree.iterfind('MODULES/*'):
+            fullname = mod.get('FULLNAME')
+            if fullname is not None:
+                self._modules.setdefault(fullname, mod)
+            self._add(self._busnames, mod, 'BUSINTERFACES/*', 'BUSNAME')
+            self._add(self._signames, mod, 'PORTS/*', 'SIGNAME')
+
+    @staticmethod
+    def _add(table: dict, mod: ElementTree.Element, path: str,
+             attribute: str) -> None:
+        seen = set()
+        for item in mod.iterfind(path):
+            name = item.get(attribute)
+            if name is None or name in seen:
+                continue
+            seen.add(name)
+            table.setdefault(name, list()).append((mod, item))
+
+    def module(self, fullname: str) -> Union[ElementTree.Element, None]:
+        """Return the MODULE element with the given FULLNAME"""
+
+        return self._modules.get(fullname)
+
+    def connected(self, busname: str) -> list:
+        """Return the (MODULE, BUSINTERFACE) pairs attached to a bus"""
+
+        return self._busnames.get(busname, list())
+
+    def ports(self, signame: str) -> list:
+        """Return the (MODULE, PORT) pairs attached to a signal"""
+
+        return self._signames.get(signame, list())
+
+    def modtype(self, modtype: str) -> list:
+        """Return the MODULE elements with the given MODTYPE"""
+
+        return [m for m in self._modules.values()
+                if m.get('MODTYPE') == modtype]
+
+
+class _HWHStreamBuilder:
+    """XMLParser target that only builds what the discovery needs
+
+    The EXTERNALINTERFACES section is kept as is. From the MODULES section
+    only the MODULE, BUSINTERFACE, PORT and the DIN_FROM/DIN_TO PARAMETER
+    elements are built, with the attributes listed in _stream_attributes.
+    Everything else, including PORTMAPS and CONNECTIONS, is dropped as soon
+    as it is parsed and never becomes an Element
+    """
+
+    def __init__(self):
+        self._builder = ElementTree.TreeBuilder()
+        self._path = list()
+        self._skip = 0
+
+    def _keep(self, tag: str, attrib: dict) -> Union[dict, None]:
+        """Return the attributes to keep or None to drop the element"""
+
+        depth = len(self._path)
+        if depth == 1:
+            return attrib
+        elif depth == 2:
+            return attrib if tag in ['EXTERNALINTERFACES', 'MODULES'] \
+                else None
+        elif self._path[1] == 'EXTERNALINTERFACES':
+            return attrib
+        elif depth == 3 and tag == 'MODULE' or \
+                depth == 5 and tag in ['BUSINTERFACE', 'PORT'] or \
+                depth == 5 and tag == 'PARAMETER' and \
+                attrib.get('NAME') in _stream_parameters:
+            return {k: attrib[k] for k in _stream_attributes[tag]
+                    if k in attrib}
+        elif depth == 4 and tag in ['BUSINTERFACES', 'PORTS', 'PARAMETERS']:
+            return dict()
+        return None
+
+    def start(self, tag: str, attrib: dict) -> None:
+        self._path.append(tag)
+        if not self._skip and (attrib := self._keep(tag, attrib)) is not None:
+            self._builder.start(tag, attrib)
+        else:
+            self._skip += 1
+
+    def end(self, tag: str) -> None:
+        if self._skip:
+            self._skip -= 1
+        else:
+            self._builder.end(tag)
+        self._path.pop()
+
+    def data(self, data: str) -> None:
+        pass
+
+    def close(self) -> ElementTree.Element:
+        return self._builder.close()
+
+
+class _HWHDocument:
+    """HWH file shared by all the discovery phases
+
+    Nothing is read on construction, only the file signature (size,
+    modification time and inode) is taken. The md5 digest and the
+    ElementTree are computed on demand reading the file in chunks, so the
+    file is never held in memory. If the tree is requested before the
+    digest both are computed in the same pass over the file
+
+    In streaming mode the parser only keeps the elements and attributes used
+    by the discovery
+    """
+
+    def __init__(self, hwh_file: str, streaming: bool = False):
+        self.name = hwh_file
+        self.streaming = streaming
+        self.signature = _file_signature(hwh_file)
+        self._digest = None
+        self._tree = None
+        self._index = None
+
+    def _read(self, parse: bool) -> None:
+        """Read the file in chunks computing the digest and optionally
+        parsing it
+        """
+
+        md5 = hashlib.md5()
+        if parse:
+            target = _HWHStreamBuilder() if self.streaming else None
+            xmlparser = ElementTree.XMLParser(target=target)
+        with open(self.name, 'rb') as file:
+            for chunk in iter(lambda: file.read(_stream_chunk), b''):
+                md5.update(chunk)
+                if parse:
+                    xmlparser.feed(chunk)
+        self._digest = md5.hexdigest()
+        if parse:
+            self._tree = ElementTree.ElementTree(xmlparser.close())
+
+    @property
+    def digest(self) -> str:
+        """md5 digest of the HWH file"""
+
+        if self._digest is None:
+            self._read(parse=False)
+        return self._digest
+
+    @property
+    def tree(self) -> ElementTree.ElementTree:
+        """Parsed HWH file"""
+
+        if self._tree is None:
+            self._read(parse=True)
+        return self._tree
+
+    @property
+    def index(self) -> _ConnectivityIndex:
+        """Connectivity index of the parsed HWH file"""
+
+        if self._index is None:
+            self._index = _ConnectivityIndex(self.tree)
+        return self._index
+
+
+def _find_connected_node(slot: dict, index: _ConnectivityIndex) -> tuple:
     """Find the the INSTANCE connected to/from current node"""
 
     s = slot.copy()
-    busname = s['busname']
-    search_term = "MODULES/*BUSINTERFACES/*/[@BUSNAME=\'" + \
-                  busname + "\']....."
-    node = tree.findall(search_term)
-    for n in node:
+    for n, m in index.connected(s['busname']):
         if n.get('FULLNAME') != s['fullname']:
-            for m in n.iter("BUSINTERFACE"):
-                if m.get('BUSNAME') == busname:
-                    n_type = n.get('MODTYPE')
-                    fullname = n.get('FULLNAME')
-                    name = m.get('NAME')
-                    s['fullname'] = fullname
-                    s['modtype'] = n_type
-                    s['name'] = name
-                    if 'xilinx.com:module_ref' in n.get('VLNV'):
-                        s['interface'] = fullname + '/' + name
-
-                    return s, n_type in (_mem_items + _dfx_item)
+            n_type = n.get('MODTYPE')
+            fullname = n.get('FULLNAME')
+            name = m.get('NAME')
+            s['fullname'] = fullname
+            s['modtype'] = n_type
+            s['name'] = name
+            if 'xilinx.com:module_ref' in n.get('VLNV'):
+                s['interface'] = fullname + '/' + name
+
+            return s, n_type in (_mem_items + _dfx_item)
     # Return same slot for elements that are not connected to another module
     return s, False
 
@@ -71,53 +275,69 @@ def _dfx_get_oposite_port(port: str) -> str:
 
 
 def _get_dfxdecoupler_decouple_gpio_pin(signame: str,
-                        tree: ElementTree,
-                        module: ElementTree.Element=None) -> Union[int, None]:
-    """Find the gpio pins that controls the DFX decoupler pin"""
-
-    search_term = "MODULES/*PORTS/*/[@SIGNAME=\'" + signame + "\']....."
-    node = tree.findall(search_term)
-    for m in node:
-        if 'xilinx.com:ip:xlslice' in (vlnv := m.get('VLNV')):
-            din_from = int(m.find("./PARAMETERS/*[@NAME='DIN_FROM']")
-                           .get('VALUE'))
-            din_to = int(m.find("./PARAMETERS/*[@NAME='DIN_FROM']")
-                         .get('VALUE'))
-            if din_from != din_to:
-                raise ValueError("{} cannot be more than 1-bit wide"
-                                 .format(signame))
-            return din_to
-        elif 'xilinx.com:ip:xpm_cdc_gen' in vlnv and m != module:
-            return _get_dfxdecoupler_decouple_gpio_pin(
-                m.find("./PORTS/*[@NAME='src_in']").get('SIGNAME'), tree, m)
-    return None
+                                        index: _ConnectivityIndex) \
+        -> Union[int, None]:
+    """Find the gpio pins that controls the DFX decoupler pin
+
+    The signal is traced back through xpm_cdc_gen modules until the xlslice
+    that drives it. Each xpm_cdc_gen is visited at most once
+    """
+
+    visited = set()
+    while True:
+        for m, _ in index.ports(signame):
+            vlnv = m.get('VLNV')
+            if 'xilinx.com:ip:xlslice' in vlnv:
+                din_from = int(m.find("./PARAMETERS/*[@NAME='DIN_FROM']")
+                               .get('VALUE'))
+                din_to = int(m.find("./PARAMETERS/*[@NAME='DIN_TO']")
+                             .get('VALUE'))
+                if din_from != din_to:
+                    raise ValueError("{} cannot be more than 1-bit wide"
+                                     .format(signame))
+                return din_to
+            elif 'xilinx.com:ip:xpm_cdc_gen' in vlnv and m not in visited:
+                visited.add(m)
+                signame = m.find("./PORTS/*[@NAME='src_in']").get('SIGNAME')
+                break
+        else:
+            return None
 
 
 def _get_dfxdecoupler_status_gpio_pin(signame: str,
-                        tree: ElementTree,
-                        module: ElementTree.Element=None) -> Union[int, None]:
-    """Find the gpio pins that gets the DFX status pin"""
-
-    search_term = "MODULES/*PORTS/*/[@SIGNAME=\'" + signame + "\']....."
-    node = tree.findall(search_term)
-    for m in node:
-        if 'xilinx.com:ip:xlconcat' in (vlnv := m.get('VLNV')):
-            return int(re.findall(r'\d+',
-                m.find(f"./PORTS/*[@SIGNAME='{signame}']").get('NAME'))[0])
-        elif 'xilinx.com:ip:xpm_cdc_gen' in vlnv and m != module:
-            return _get_dfxdecoupler_status_gpio_pin(
-                m.find("./PORTS/*[@NAME='dest_out']").get('SIGNAME'), tree, m)
-    return None
-
-
-def _dfx_ip_discovery(partial_region: str, partial_hwh: str) -> dict:
+                                      index: _ConnectivityIndex) \
+        -> Union[int, None]:
+    """Find the gpio pins that gets the DFX status pin
+
+    The signal is traced forward through xpm_cdc_gen modules until the
+    xlconcat that reads it. Each xpm_cdc_gen is visited at most once
+    """
+
+    visited = set()
+    while True:
+        for m, port in index.ports(signame):
+            vlnv = m.get('VLNV')
+            if 'xilinx.com:ip:xlconcat' in vlnv:
+                return int(re.findall(r'\d+', port.get('NAME'))[0])
+            elif 'xilinx.com:ip:xpm_cdc_gen' in vlnv and m not in visited:
+                visited.add(m)
+                signame = m.find("./PORTS/*[@NAME='dest_out']").get('SIGNAME')
+                break
+        else:
+            return None
+
+
+def _dfx_ip_discovery(partial_region: str, partial_hwh: str,
+                      tree: ElementTree.ElementTree = None) -> dict:
     """Hardware discovery on partial bitstreams
 
     Parse partial HWH file and return dictionary with IP and interface
-    connections
+    connections. If tree is given, it is used instead of parsing the file
     """
 
-    tree = ElementTree.parse(partial_hwh)
+    if tree is None:
+        tree = ElementTree.parse(partial_hwh)
+    index = _ConnectivityIndex(tree)
     ext_if = dict()
 
     for mod in tree.findall('EXTERNALINTERFACES/BUSINTERFACE'):
@@ -135,11 +355,7 @@ def _dfx_ip_discovery(partial_region: str, partial_hwh: str) -> dict:
 
     _deep_exp = []
     for k in ext_if:
-        search_text = "MODULES/*BUSINTERFACES/*/[@BUSNAME=\'" + \
-                     ext_if[k]['busname'] + "\']....."
-        mod = tree.findall(search_text)
-
-        for i in mod:
+        for i, _ in index.connected(ext_if[k]['busname']):
             fullname = i.get('FULLNAME')
             ext_if[k]['fullname'] = fullname
             ext_if[k]['modtype'] = i.get('MODTYPE')
@@ -148,13 +364,11 @@ def _dfx_ip_discovery(partial_region: str, partial_hwh: str) -> dict:
 
     while _deep_exp:
         k = _deep_exp[0]
-        fullname = ext_if[k]['fullname']
-        search_text = "MODULES/*/[@FULLNAME=\'" + fullname + "\']"
-        mod = tree.find(search_text)
+        mod = index.module(ext_if[k]['fullname'])
         for i in mod.iter('BUSINTERFACE'):
             if i.get('BUSNAME') != ext_if[k]['busname']:
                 ext_if[k]['busname'] = i.get('BUSNAME')
-                ext_if[k], ismem = _find_connected_node(ext_if[k], tree)
+                ext_if[k], ismem = _find_connected_node(ext_if[k], index)
                 if not ismem:
                     del _deep_exp[0]
                 break
@@ -175,6 +389,43 @@ def _dfx_ip_discovery(partial_region: str, partial_hwh: str) -> dict:
     return dfx_dict
 
 
+def _verify_cache(hwh_file: str, digest: str, cachefile: str) -> None:
+    """Remove the cache files if the HWH file digest does not match"""
+
+    if _file_digest(hwh_file) != digest:
+        warnings.warn("{} changed without updating its signature, the cache "
+                      "{} has been removed".format(hwh_file, cachefile))
+        _cache.remove(cachefile)
+
+
+def _discover_partial(partial_region: str, partial_hwh: str) -> tuple:
+    """Hash and run _dfx_ip_discovery on a partial HWH reading it once
+
+    Returns the signature, the md5 digest and the discovery result
+    """
+
+    signature = _file_signature(partial_hwh)
+    with open(partial_hwh, 'rb') as file:
+        content = file.read()
+    tree = ElementTree.ElementTree(ElementTree.fromstring(content))
+    return signature, hashlib.md5(content).hexdigest(), \
+        _dfx_ip_discovery(partial_region, partial_hwh, tree)
+
+
+def _discover_partials(jobs: list, workers: int) -> list:
+    """Run _discover_partial for each (partial_region, partial_hwh) job
+
+    Partial HWH files are independent of each other, so when there is more
+    than one job and more than one worker they are parsed in a process pool.
+    Results are returned in the same order as jobs
+    """
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as executor:
+            return list(executor.map(_discover_partial, *zip(*jobs)))
+    return [_discover_partial(r, h) for r, h in jobs]
+
+
 class HWHComposable:
     """Parse the HWH file(s) to create the composable connectivity map
 
@@ -196,6 +447,13 @@ class HWHComposable:
         {str: {'decoupler' : str, 'gpio' : {'decouple' : int, 'status' : int},
         'ip': dict}}
 
+    timing : dict
+        Wall-clock time in seconds spent in each phase of the discovery.
+        Phases that were not executed, for instance because the cache was
+        valid, are not present
+
+        {str: float}
+
     Note
     ----
     This class requires that partial bitstreams and corresponding HWH files
@@ -219,7 +477,9 @@ class HWHComposable:
         base_composable_pr_1_function_2.hwh
 
     """
-    def __init__(self, hwh_file: str, switch_name: str, cache=True):
+    def __init__(self, hwh_file: str, switch_name: str, cache=True,
+                 streaming=False, workers=None, verify=False, lazy=False,
+                 _document=None):
         """Return a new HWHComposable object.
 
         Performs a hardware discovery where the different IP cores connected
@@ -233,7 +493,29 @@ class HWHComposable:
         switch_name : str
             AXI4-Stream Switch name
         cache : bool
-            Use cache file
+            Use the discovery cache, stored in the directory returned by
+            pynq_composable.cache.cache_dir(). If it is missing, the cache
+            shipped next to the HWH file is used when its digest matches.
+            Caches written by previous versions as <hwh>_<hier>.pkl are not
+            read, the first discovery writes the new cache
+        streaming : bool
+            Parse the HWH file incrementally keeping only the data required
+            for the discovery. This reduces the peak memory for large HWH
+            files
+        workers : int
+            Maximum number of processes used to parse the partial HWH files.
+            Default is 1, the process pool only pays off for many or large
+            partial HWH files
+        verify : bool
+            The cache is considered valid when the size, modification time
+            and inode of the HWH file match the ones recorded in the cache,
+            without reading the file. If verify is True, the md5 digest is
+            also checked in a background thread and the cache file is
+            removed, with a warning, if it does not match
+        lazy : bool
+            Do not parse the partial HWH files missing from the cache until
+            their DFX region is resolved, see resolve(). The c_dict only has
+            the IP of the static region and of the cached partial HWH files
         """
 
         self._hwh_name = hwh_file
@@ -243,35 +525,161 @@ class HWHComposable:
             self._switch_name = '/' + switch_name
         self._hier = switch_name.rsplit('/', 1)[0]
         self._dir_name = os.path.dirname(hwh_file)
+        self._workers = workers or 1
+        self._partial_pattern = None
+        self._partials = None
+        self._pending = None
+        self._lazy = lazy
+        self.timing = dict()
+
+        self._hwh = _document or _HWHDocument(self._hwh_name, streaming)
+        signature = self._hwh.signature
+        self._verifier = None
+        cached = None
+        valid = False
+
+        cachefile = _cache.cache_path(self._hwh_name, self._hier)
+        if cache:
+            cached = self._timed('cache', _cache.load, cachefile) or \
+                _cache.load(_cache.local_path(self._hwh_name, self._hier),
+                            touch=False)
+
+        if cached and cached['signature'] == signature:
+            valid = True
+            hwhdigest = cached['digest']
+            if verify:
+                self._verifier = threading.Thread(
+                    target=_verify_cache, daemon=True,
+                    args=(self._hwh_name, hwhdigest, cachefile))
+                self._verifier.start()
+        elif cached:
+            # One pass computes the digest and the tree, the tree is only
+            # used if the digest does not match
+            self._timed('parse', lambda: self._hwh.tree)
+            hwhdigest = self._hwh.digest
+            valid = cached['digest'] == hwhdigest
+
+        if cache:
+            _cache.record(valid)
+        if valid:
+            self._static_dict = cached['static_dict']
+            self._default_dfx_dict = cached['default_dfx_dict']
+            self._regions = cached['regions']
+            self._switches = cached.get('switches')
+        else:
+            self._timed('parse', lambda: self._hwh.index)
+            self._timed('hardware', self._hardware_discovery)
+            self._timed('dfx_regions', self._dfx_regions_discovery)
+            self._switches = [m.get('FULLNAME').lstrip('/') for m in
+                              self._hwh.index.modtype('axis_switch')]
+            hwhdigest = self._hwh.digest
+        self._hwh = None
+
+        self.c_dict = self._static_dict
+        self.dfx_dict = {k: dict(v) for k, v in self._regions.items()}
+        self._timed('partial_bitstreams', self._partial_bitstreams_discovery)
+        self._timed('dfx_ip', self._insert_dfx_ip,
+                    cached['partials'] if cached else dict())
+
+        self._cachefile = cachefile
+        self._digest = hwhdigest
+        self._signature = signature
+        if not valid or cached['signature'] != signature or \
+                cached['partials'] != \
+                {k: v for k, v in self._partials.items() if v}:
+            self._save_cache()
+
+    def _save_cache(self, basename: str = None) -> None:
+        """Write the discovery results to the cache
+
+        Parameters
+        ----------
+        basename : str
+            Cache filename without extension, default is the central cache
+        """
+
+        try:
+            _cache.save(basename or self._cachefile, {
+                'switch': self._switch_name.lstrip('/'),
+                'switches': self._switches,
+                'digest': self._digest,
+                'signature': self._signature,
+                'static_dict': self._static_dict,
+                'default_dfx_dict': self._default_dfx_dict,
+                'regions': self._regions,
+                'partials': {k: v for k, v in self._partials.items() if v}})
+        except OSError as err:
+            warnings.warn("Discovery cache could not be written: {}"
+                          .format(err))
+
+    def register_rm(self, region: str, bitfile: str) -> dict:
+        """Add a reconfigurable module to a DFX region
+
+        Only the partial HWH file of the new reconfigurable module is parsed,
+        its IP are added to the c_dict and dfx_dict and its entry is added to
+        the cache. Registering an existing reconfigurable module parses it
+        again
+
+        Parameters
+        ----------
+        region : str
+            DFX region name
+        bitfile : str
+            Partial bitstream, it must be next to the global hwh file and
+            follow the naming convention
+            <bitstream>_<hier>_<pr_region>_<rm>.bit
+
+        Returns
+        -------
+        Dictionary with the IP of the reconfigurable module
+        """
 
-        with open(self._hwh_name, 'rb') as file:
-            hwhdigest = hashlib.md5(file.read()).hexdigest()
-        cached_digest = None
-
-        pklfile = os.path.splitext(self._hwh_name)[0] + '_' + \
-            self._hier + '.pkl'
-        if os.path.isfile(pklfile) and cache:
-            with open(pklfile, "rb") as file:
-                cached_digest, self.c_dict, self.dfx_dict = pkl.load(file)
-        if not os.path.isfile(pklfile) or cached_digest != hwhdigest:
-            self._hardware_discovery()
-            self._dfx_regions_discovery()
-            self._partial_bitstreams_discovery()
-            self._insert_dfx_ip()
-            with open(pklfile, "wb") as file:
-                pkl.dump([hwhdigest, self.c_dict, self.dfx_dict], file)
+        if region not in self.dfx_dict:
+            raise ValueError("DFX region \'{}\' does not exist"
+                             .format(region))
+
+        bitname = os.path.basename(bitfile)
+        if self.partial_region(bitname) != region:
+            raise ValueError("\'{}\' does not follow the naming convention "
+                             "for the DFX region \'{}\'"
+                             .format(bitname, region))
+        bitpath = os.path.join(self._dir_name, bitname)
+        hwh_name = os.path.splitext(bitpath)[0] + '.hwh'
+        for file in [bitpath, hwh_name]:
+            if not os.path.isfile(file):
+                raise FileNotFoundError("{} does not exist".format(file))
+
+        if hwh_name in self._pending.get(region, list()):
+            self._pending[region].remove(hwh_name)
+            if not self._pending[region]:
+                del self._pending[region]
+        signature, digest, dfx_dict = _discover_partial(region, hwh_name)
+        self._partials[bitname] = {'digest': digest, 'signature': signature,
+                                   'region': region, 'dfx_dict': dfx_dict}
+        self.dfx_dict[region].setdefault('rm', dict())[bitname] = dfx_dict
+        self._update_ip_dict_with_dfx(region, dfx_dict)
+        self._save_cache()
+        return dfx_dict
+
+    def _timed(self, phase: str, func, *args):
+        """Call func and add its wall-clock time to phase"""
+
+        start = time.perf_counter()
+        result = func(*args)
+        self.timing[phase] = self.timing.get(phase, 0.0) + \
+            time.perf_counter() - start
+        return result
 
     def _hardware_discovery(self) -> None:
         """Discover how functions are connected to the switch"""
 
-        tree = ElementTree.parse(self._hwh_name)
+        index = self._hwh.index
         switch_conn = {}
         self._deep_exp = []
 
-        search_term = "MODULES/*/[@FULLNAME=\'" + self._switch_name + "\']"
-        node = tree.find(search_term)
+        node = index.module(self._switch_name)
 
-        if not node:
+        if node is None:
             raise AttributeError("AXI4-Switch {} does not exist in the hwh "
                                  "file".format(self._switch_name.lstrip('/')))
 
@@ -287,7 +695,8 @@ class HWHComposable:
                 }
 
         for s in switch_conn:
-            switch_conn[s], ismem = _find_connected_node(switch_conn[s], tree)
+            switch_conn[s], ismem = \
+                _find_connected_node(switch_conn[s], index)
             if ismem:
                 self._deep_exp.append(s)
 
@@ -296,9 +705,7 @@ class HWHComposable:
         while deep_exp:
             port = deep_exp[0]
             port_type = switch_conn[port]['type']
-            fullname = switch_conn[port]['fullname']
-            search_term = "MODULES/*/[@FULLNAME=\'" + fullname + "\']"
-            node = tree.find(search_term)
+            node = index.module(switch_conn[port]['fullname'])
             mod_type = node.get('MODTYPE')
             oposite_port = _dfx_get_oposite_port(switch_conn[port]['name'])
             for bus in node.iter("BUSINTERFACE"):
@@ -309,7 +716,8 @@ class HWHComposable:
                 if mod_type in _mem_items and port_type == b_type and \
                         busname != switch_conn[port]['busname']:
                     switch_conn[port]['busname'] = busname
-                    conn, ismem = _find_connected_node(switch_conn[port], tree)
+                    conn, ismem = _find_connected_node(switch_conn[port],
+                                                       index)
 
                     if 'axis_switch' not in conn['modtype']:
                         switch_conn[port] = conn
@@ -323,7 +731,7 @@ class HWHComposable:
                     switch_conn[port]['dfx'] = True
                     switch_conn[port]['decoupler'] = node.get('FULLNAME')
                     switch_conn[port], ismem = \
-                        _find_connected_node(switch_conn[port], tree)
+                        _find_connected_node(switch_conn[port], index)
                     if not ismem:
                         del deep_exp[0]
                     break
@@ -388,52 +796,168 @@ class HWHComposable:
                     dfx_dict[key] = dict()
                 dfx_dict[key]['decoupler'] = v['decoupler']
 
-        tree = ElementTree.parse(self._hwh_name)
+        index = self._hwh.index
 
         for d in dfx_dict:
-            decoupler = dfx_dict[d]['decoupler']
-            search_term = "MODULES/*/[@FULLNAME=\'" + decoupler + "\']"
-            node = tree.find(search_term)
+            node = index.module(dfx_dict[d]['decoupler'])
             dfx_dict[d]['decouple'] = _get_dfxdecoupler_decouple_gpio_pin(
-                node.find("./PORTS/*[@NAME='decouple']").get('SIGNAME'), tree)
+                node.find("./PORTS/*[@NAME='decouple']").get('SIGNAME'),
+                index)
             dfx_dict[d]['status'] = _get_dfxdecoupler_status_gpio_pin(
                 node.find("./PORTS/*[@NAME='decouple_status']")
-                .get('SIGNAME'), tree)
+                .get('SIGNAME'), index)
 
-        self.dfx_dict = dfx_dict
+        self._regions = dfx_dict
 
     def _partial_bitstreams_discovery(self) -> None:
-        """Search for partial bitstreams and add them to the dictionary"""
-
-        filelist = glob.glob(self._dir_name + '/*.bit')
-        working_list = filelist.copy()
-
-        for key in self.dfx_dict:
-            bitkey = key.replace('/', '_')
-            for f in working_list:
-                file = os.path.split(f)[1]
-                if bitkey in file:
-                    if 'rm' not in self.dfx_dict[key].keys():
-                        self.dfx_dict[key]['rm'] = dict()
-                    self.dfx_dict[key]['rm'][file] = dict()
-                    filelist.remove(f)
-            working_list = filelist.copy()
-
-    def _insert_dfx_ip(self) -> None:
+        """Search for partial bitstreams and add them to the dictionary
+
+        Partial bitstreams are named <bitstream>_<hier>_<pr_region>_<rm>.bit,
+        only the files with the bitstream and hierarchy prefix are listed and
+        each one is classified with a single match. Regions are tried longest
+        first, so pr_1 never takes the files of pr_10. Files that do not
+        belong to any region are skipped
+        """
+
+        if not self.dfx_dict:
+            return
+        prefix = os.path.splitext(os.path.basename(self._hwh_name))[0] + \
+            '_' + self._hier.replace('/', '_') + '_'
+
+        filelist = glob.glob(os.path.join(glob.escape(self._dir_name),
+                                          glob.escape(prefix) + '*.bit'))
+        for f in sorted(filelist):
+            file = os.path.basename(f)
+            region = self.partial_region(file)
+            if region:
+                self.dfx_dict[region].setdefault('rm', dict())[file] = dict()
+
+    def partial_region(self, bitname: str) -> Union[str, None]:
+        """Return the DFX region of a partial bitstream name, or None
+
+        The pattern is <bitstream>_<hier>_(<regions>)_<rm>.bit with the
+        regions sorted longest first, so pr_1 does not match a pr_10
+        bitstream. It is compiled once
+
+        Parameters
+        ----------
+        bitname : str
+            Partial bitstream filename, without directory
+        """
+
+        if self._partial_pattern is None:
+            prefix = os.path.splitext(os.path.basename(self._hwh_name))[0] + \
+                '_' + self._hier.replace('/', '_') + '_'
+            self._partial_regions = \
+                {k.replace('/', '_'): k for k in self.dfx_dict}
+            alternation = '|'.join(re.escape(r) for r in sorted(
+                self._partial_regions, key=len, reverse=True))
+            self._partial_pattern = re.compile(
+                re.escape(prefix) + '(' + alternation + r')_.+\.bit$')
+
+        match = self._partial_pattern.match(bitname)
+        return self._partial_regions[match.group(1)] if match else None
+
+    def _insert_dfx_ip(self, partials: dict) -> None:
         """Insert IP from dfx regions into the c_dict
 
         Iterate over partial bitstreams and add all IP within dfx regions
-        into the self.c_dict
+        into the self.c_dict. The discovery result of each partial HWH is
+        cached by its own digest, only new or modified partial HWH files are
+        parsed. As for the global HWH file, a partial HWH is only hashed if
+        its size, modification time or inode changed. These are parsed in
+        parallel and merged in region and bitstream order
+
+        In lazy mode the partial HWH files that need to be parsed are left
+        pending until their region is resolved
+
+        Parameters
+        ----------
+        partials : dict
+            Previously cached partial HWH discovery results
+            {str: {'digest': str, 'signature': list, 'region': str,
+            'dfx_dict': dict}}
         """
 
+        self._partials = dict()
+        self._pending = dict()
+        jobs = list()
         for r in self.dfx_dict:
             for b in self.dfx_dict[r].get('rm', list()):
-                hwh_name = self._dir_name + '/' + \
-                    os.path.splitext(b)[0] + '.hwh'
+                hwh_name = os.path.join(self._dir_name,
+                                        os.path.splitext(b)[0] + '.hwh')
                 if os.path.exists(hwh_name):
-                    dfx_dict = _dfx_ip_discovery(r, hwh_name)
-                    self.dfx_dict[r]['rm'][b] = dfx_dict
-                    self._update_ip_dict_with_dfx(r, dfx_dict)
+                    signature = _file_signature(hwh_name)
+                    entry = partials.get(b)
+                    if entry and entry['region'] == r and \
+                            entry.get('signature') != signature and \
+                            entry['digest'] == _file_digest(hwh_name):
+                        entry = dict(entry, signature=signature)
+                    elif not entry or entry['region'] != r or \
+                            entry.get('signature') != signature:
+                        entry = None
+                        jobs.append((r, hwh_name))
+                    self._partials[b] = entry
+
+        if self._lazy:
+            for r, hwh_name in jobs:
+                self._pending.setdefault(r, list()).append(hwh_name)
+        else:
+            self._parse_partials(jobs)
+
+        for b, entry in self._partials.items():
+            if entry:
+                self.dfx_dict[entry['region']]['rm'][b] = entry['dfx_dict']
+                self._update_ip_dict_with_dfx(entry['region'],
+                                              entry['dfx_dict'])
+
+    def _parse_partials(self, jobs: list) -> None:
+        """Parse the (partial_region, partial_hwh) jobs into self._partials"""
+
+        results = _discover_partials(jobs, self._workers)
+        for (r, hwh_name), (signature, digest, dfx_dict) in \
+                zip(jobs, results):
+            b = os.path.splitext(os.path.basename(hwh_name))[0] + '.bit'
+            self._partials[b] = {'digest': digest, 'signature': signature,
+                                 'region': r, 'dfx_dict': dfx_dict}
+
+    @property
+    def pending(self) -> list:
+        """DFX regions with partial HWH files not parsed yet"""
+
+        return list(self._pending or dict())
+
+    def resolve(self, region: str = None) -> list:
+        """Parse the pending partial HWH files of a DFX region
+
+        Only needed in lazy mode. The IP of the region are added to the
+        c_dict and dfx_dict and the cache is updated
+
+        Parameters
+        ----------
+        region : str
+            DFX region name, all the regions are resolved if None
+
+        Returns
+        -------
+        List with the name of the IP that were added
+        """
+
+        regions = self.pending if region is None else [region]
+        jobs = [(r, h) for r in regions for h in self._pending.pop(r, list())]
+        if not jobs:
+            return list()
+
+        self._parse_partials(jobs)
+        ips = list()
+        for b, entry in self._partials.items():
+            if entry and entry['region'] in regions:
+                self.dfx_dict[entry['region']]['rm'][b] = entry['dfx_dict']
+                self._update_ip_dict_with_dfx(entry['region'],
+                                              entry['dfx_dict'])
+                ips += [ip for ip in entry['dfx_dict'] if ip not in ips]
+        self._save_cache()
+        return ips
 
     def _update_ip_dict_with_dfx(self, partial_region: str,
                                  dfx_dict: dict) -> None:
@@ -465,23 +989,192 @@ class HWHComposable:
         self.c_dict = updated_dict
 
 
+def discover_switches(hwh_file: str, cache=True, streaming=False,
+                      workers=None) -> dict:
+    """Run the hardware discovery for every AXI4-Stream Switch
+
+    The HWH file is read, hashed and parsed once and the connectivity index
+    is shared by the discovery of all the switches, each one writes its own
+    cache
+
+    Parameters
+    ----------
+    hwh_file : str
+        global hwh file
+    cache : bool
+        Use the discovery cache
+    streaming : bool
+        Parse the HWH file incrementally
+    workers : int
+        Maximum number of processes used to parse the partial HWH files
+
+    Returns
+    -------
+    Dictionary with the switch name as key and its HWHComposable as value
+    """
+
+    document = _HWHDocument(hwh_file, streaming)
+    switches = dict()
+    for mod in document.index.modtype('axis_switch'):
+        switch_name = mod.get('FULLNAME').lstrip('/')
+        switches[switch_name] = HWHComposable(hwh_file, switch_name, cache,
+                                              streaming, workers,
+                                              _document=document)
+    return switches
+
+
+def _has_switch(hwh_file: str) -> bool:
+    """Return whether a HWH file has an AXI4-Stream Switch module
+
+    The file is scanned in chunks, it is not parsed
+    """
+
+    needle = b'MODTYPE="axis_switch"'
+    tail = b''
+    with open(hwh_file, 'rb') as file:
+        for chunk in iter(lambda: file.read(_stream_chunk), b''):
+            chunk = tail + chunk
+            if needle in chunk:
+                return True
+            tail = chunk[-len(needle) + 1:]
+    return False
+
+
+def find_overlays(pattern: str, skipped: list = None) -> list:
+    """Return the global HWH files in a directory or matching a glob
+
+    Partial HWH files, named <bitstream>_<hier>_<pr_region>_<rm>.hwh after
+    a global HWH file and without an AXI4-Stream Switch, are skipped. A HWH
+    file with such a name that has a switch, like base_zu_rev_b.hwh next to
+    base.hwh, is a global HWH file
+
+    Parameters
+    ----------
+    pattern : str
+        Directory or glob pattern
+    skipped : list
+        If given, the partial HWH files that were skipped are appended to it
+    """
+
+    if os.path.isdir(pattern):
+        pattern = os.path.join(glob.escape(pattern), '*.hwh')
+    hwhlist = sorted(glob.glob(pattern))
+    stems = {os.path.splitext(h)[0] for h in hwhlist}
+    overlays = list()
+    for hwh in hwhlist:
+        stem = os.path.splitext(hwh)[0]
+        if any(stem.startswith(s + '_') and
+               stem[len(s) + 1:].count('_') >= 2 for s in stems) and \
+                not _has_switch(hwh):
+            if skipped is not None:
+                skipped.append(hwh)
+        else:
+            overlays.append(hwh)
+    return overlays
+
+
+def _prewarm_overlay(hwh_file: str, streaming: bool) -> tuple:
+    """Discover every switch of a HWH file unless its caches are valid
+
+    The caches are only valid if there is one for every switch in the HWH
+    file, as recorded by each cache
+
+    Returns the status, the elapsed time and the timing of each switch
+    """
+
+    start = time.perf_counter()
+    signature = _file_signature(hwh_file)
+    cached = [c for c in _cache.find(hwh_file) if c.get('switch')]
+    names = {c['switch'] for c in cached}
+    if cached and all(c['signature'] == signature and
+                      c.get('switches') is not None and
+                      names.issuperset(c['switches']) for c in cached):
+        status = 'cached'
+        switches = {c['switch']: HWHComposable(hwh_file, c['switch'],
+                                               workers=1)
+                    for c in cached}
+    else:
+        status = 'discovered'
+        switches = discover_switches(hwh_file, True, streaming, 1)
+    return status, time.perf_counter() - start, \
+        {k: v.timing for k, v in switches.items()}
+
+
+def prewarm(overlays: list, workers: int = None, streaming=False) -> dict:
+    """Generate the discovery caches of several overlays in parallel
+
+    Overlays whose caches are valid for every switch are not parsed again,
+    only their partial HWH files are checked
+
+    Parameters
+    ----------
+    overlays : list
+        Global HWH files
+    workers : int
+        Maximum number of processes, default is the number of CPUs
+    streaming : bool
+        Parse the HWH files incrementally
+
+    Returns
+    -------
+    Dictionary with the HWH file as key and a tuple with the status,
+    'cached' or 'discovered', the elapsed time and the timing of each switch
+    as value
+    """
+
+    workers = workers or os.cpu_count() or 1
+    args = [(hwh, streaming) for hwh in overlays]
+    if workers > 1 and len(overlays) > 1:
+        with ProcessPoolExecutor(min(workers, len(overlays))) as executor:
+            results = list(executor.map(_prewarm_overlay, *zip(*args)))
+    else:
+        results = [_prewarm_overlay(*a) for a in args]
+    return dict(zip(overlays, results))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Generate composable cached file"
     )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "--hwh", help="global hwh file"
+    )
+    group.add_argument(
+        "--batch", help="directory or glob pattern of global hwh files, the "
+        "caches are generated in parallel"
+    )
     parser.add_argument(
-        "--hwh", help="global hwh file", required=True
+        "--streaming", help="parse the hwh file incrementally",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--workers", help="maximum number of processes", type=int,
+        default=None
     )
     args = parser.parse_args()
 
-    print(args.hwh)
-
-    tree = ElementTree.parse(args.hwh)
-    tree_root = tree.getroot()
-
-    for mod in tree_root.iter("MODULE"):
-        mod_type = mod.get('MODTYPE')
-        if mod_type == 'axis_switch':
-            switch_name = mod.get('FULLNAME').lstrip('/')
-            HWHComposable(args.hwh, switch_name, False)
+    if args.batch:
+        skipped = list()
+        overlays = find_overlays(args.batch, skipped)
+        for hwh in skipped:
+            print("{:<60} partial".format(hwh))
+        start = time.perf_counter()
+        results = prewarm(overlays, args.workers, args.streaming)
+        for hwh, (status, elapsed, timing) in results.items():
+            print("{:<60} {:<10} {:8.3f} s".format(hwh, status, elapsed))
+            for switch_name, phases in timing.items():
+                print("    {}".format(switch_name))
+                for phase, seconds in phases.items():
+                    print("        {:<20} {:8.3f} s".format(phase, seconds))
+        print("{} overlays in {:.3f} s".format(
+            len(overlays), time.perf_counter() - start))
+    else:
+        print(args.hwh)
+        for switch_name, hwhparser in discover_switches(
+                args.hwh, False, args.streaming, args.workers).items():
+            hwhparser._save_cache(_cache.local_path(args.hwh,
+                                                    hwhparser._hier))
             print("Cache file for {} generated".format(switch_name))
+            for phase, elapsed in hwhparser.timing.items():
+                print("    {:<20} {:8.3f} s".format(phase, elapsed))
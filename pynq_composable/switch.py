@@ -9,12 +9,7 @@ __author__ = "Mario Ruiz"
 __copyright__ = "Copyright 2021, Xilinx"
 __email__ = "pynq_support@xilinx.com"
 
-
-def _mux_mi_gen(ports: int) -> tuple:
-    """Generates index and address for AXI4-Stream Switch MI Mux Registers"""
-
-    for i in range(ports):
-        yield i, 0x40 + 4 * i
+_shadows = dict()
 
 
 class StreamSwitch(DefaultIP):
@@ -28,6 +23,12 @@ class StreamSwitch(DefaultIP):
     able to access the consumer interface.
     Unused producer interfaces are automatically disabled by the logic
     provided in this driver
+
+    Attributes
+    ----------
+    register_writes : int
+        Number of register writes, commit included, done by the last
+        reconfiguration
     """
 
     bindto = ['xilinx.com:ip:axis_switch:1.1']
@@ -40,6 +41,28 @@ class StreamSwitch(DefaultIP):
         super().__init__(description=description)
         self.max_slots = int(description['parameters']['C_NUM_MI_SLOTS'])
         self._pi = np.zeros(self.max_slots, dtype=np.int64)
+        self.invalidate()
+        self.register_writes = 0
+
+    @property
+    def _committed(self) -> np.ndarray:
+        """Last committed configuration, shared by the drivers of a switch"""
+
+        return _shadows.get(self.mmio.base_addr)
+
+    @_committed.setter
+    def _committed(self, conf_array: np.ndarray) -> None:
+        _shadows[self.mmio.base_addr] = conf_array
+
+    def invalidate(self) -> None:
+        """Drop the shadow of the committed configuration
+
+        The next read of pi reads the MI mux registers and the next write
+        writes all of them. Creating a driver invalidates the shadow, call
+        it if the switch may have been configured by other means
+        """
+
+        _shadows.pop(self.mmio.base_addr, None)
 
     def default(self) -> None:
         """Generate default configuration
@@ -82,11 +105,16 @@ class StreamSwitch(DefaultIP):
                 Consumer 1 will be routed to Producer 2\n
                 Consumer 0 will be routed to Producer 3\n
                 Producer 0 is disabled
+
+        Reads are served from a shadow of the last committed configuration,
+        shared by all the drivers of the same switch, the registers are only
+        read if there is no shadow. Use refresh() and verify() to check
+        the hardware
         """
-        pi = np.zeros(self.max_slots, dtype=np.int64)
-        for idx, offset in _mux_mi_gen(self.max_slots):
-            pi[idx] = self.read(offset)
-        return pi
+
+        if self._committed is None:
+            self.refresh()
+        return np.copy(self._committed)
 
     @pi.setter
     def pi(self, conf_array: np.dtype(np.int64)):
@@ -113,6 +141,38 @@ class StreamSwitch(DefaultIP):
         self._pi = conf_array
         self._populateRouting()
 
+    def _read_mi(self) -> np.ndarray:
+        """Read the MI mux register block in one access"""
+
+        start = self._pi_offset // 4
+        block = self.mmio.array[start:start + self.max_slots]
+        if isinstance(block, np.ndarray):
+            return block.astype(np.int64)
+        return np.fromiter(block, dtype=np.int64, count=self.max_slots)
+
+    def refresh(self) -> np.ndarray:
+        """Read the MI mux registers and update the shadow
+
+        Returns the configuration read from the hardware
+        """
+
+        self._committed = self._read_mi()
+        self._pi = np.copy(self._committed)
+        return np.copy(self._committed)
+
+    def verify(self) -> np.ndarray:
+        """Compare the MI mux registers with the shadow
+
+        The shadow is not modified. Returns the index of the MI mux
+        registers that drifted from the shadow, an empty array if they are
+        in sync. All the registers are reported if there is no shadow yet
+        """
+
+        hardware = self._read_mi()
+        if self._committed is None:
+            return np.arange(self.max_slots)
+        return np.flatnonzero(hardware != self._committed)
+
     def _populateRouting(self):
         """Writes the current configuration to the AXI4-Stream Switch
 
@@ -121,8 +181,19 @@ class StreamSwitch(DefaultIP):
         register transfers the programmed values from the register interface
         into the switch, for a short period of time the AXI4-Stream Switch
         interfaces are held in reset.
+
+        Only the registers that differ from the last committed configuration
+        are written and the commit is skipped if there are none
         """
 
-        for idx, offset in _mux_mi_gen(self.max_slots):
-            self.write(offset, int(self._pi[idx]))
-        self.write(self._control_reg, self._reg_update)
+        if self._committed is None:
+            changed = range(self.max_slots)
+        else:
+            changed = np.flatnonzero(self._pi != self._committed)
+
+        for idx in changed:
+            self.write(self._pi_offset + 4 * int(idx), int(self._pi[idx]))
+        if len(changed):
+            self.write(self._control_reg, self._reg_update)
+            self._committed = self._pi.astype(np.int64)
+        self.register_writes = len(changed) + (1 if len(changed) else 0)
@@ -7,6 +7,7 @@ import cv2
 from enum import Enum, auto
 import json
 import os
+from .libs import clear_resolution, set_resolution
 from pynq import Overlay
 from pynq.lib.video import DrmDriver, VideoMode, PIXEL_RGB
 from pynq.lib.video.clocks import *
@@ -514,8 +515,15 @@ class VideoStream:
     .start: configures hdmi_in and hdmi_out starts them and tie them together
     .stop: closes hdmi_in and hdmi_out
 
+    Attributes
+    ----------
+    resolution_file : bool
+        Also write the resolution to /tmp/resolution.json, for processes
+        that use a previous version of pynq_composable. Default is False,
+        the resolution is only registered in this process
     """
     _fres = "/tmp/resolution.json"
+    resolution_file = False
 
     def __init__(self, ol: Overlay, source: VSource = VSource.HDMI,
                  sink: VSink = VSink.HDMI, file: int = 0,
@@ -548,9 +556,12 @@ class VideoStream:
         elif source == VSource.OpenCV and sink == VSink.DP:
             self._video = OpenCVDPVideo(ol=ol, filename=file, mode=mode)
 
-        reso = {"width": mode.width, "height": mode.height, "fps": mode.fps}
-        with open(self._fres, "w", encoding="utf-8") as f:
-            json.dump(reso, f)
+        set_resolution(mode.width, mode.height)
+        if self.resolution_file:
+            reso = {"width": mode.width, "height": mode.height,
+                    "fps": mode.fps}
+            with open(self._fres, "w", encoding="utf-8") as f:
+                json.dump(reso, f)
 
     def start(self):
         """Start the video stream"""
@@ -559,7 +570,8 @@ class VideoStream:
     def stop(self):
         """Stop the video stream"""
 
-        if os.path.exists(self._fres):
+        clear_resolution()
+        if self.resolution_file and os.path.exists(self._fres):
             os.remove(self._fres)
         self._video.stop()
 
@@ -0,0 +1,30 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+import pytest
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the discovery caches of each test in its own directory"""
+
+    directory = tmp_path / "cache"
+    monkeypatch.setenv('PYNQ_COMPOSABLE_CACHE_DIR', str(directory))
+    yield directory
+
+
+@pytest.fixture(autouse=True)
+def resolutions(tmp_path, monkeypatch):
+    """Start each test with an empty resolution registry and no file"""
+
+    from pynq_composable import libs
+    monkeypatch.setattr(libs, '_resolutions', dict())
+    monkeypatch.setattr(libs, '_resolution_file',
+                        str(tmp_path / "resolution.json"))
+    yield libs._resolutions
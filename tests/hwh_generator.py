@@ -0,0 +1,278 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""Write synthetic composable overlays (global HWH plus partial HWH/bit)
+
+The generated hierarchy has an AXI4-Stream Switch with one port for each
+static IP and one port for each DFX region. Each DFX region is a module_ref
+behind a DFX decoupler whose decouple and status pins are driven by a
+xlslice and a xlconcat. Every reconfigurable module contributes a partial
+HWH and an empty partial bitstream following the naming convention
+
+    <name>_<hier>_<pr_region>_<rm>.{bit|hwh}
+
+synthetic_composable() builds a Composable object on top of a synthetic overlay
+without hardware
+"""
+
+import os
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+_axis = 'xilinx.com:interface:axis:1.0'
+_chain_vlnv = {
+    'axis_data_fifo': 'xilinx.com:ip:axis_data_fifo:2.0',
+    'axis_register_slice': 'xilinx.com:ip:axis_register_slice:1.1'
+}
+
+
+def _bus(name: str, bustype: str, busname: str, vlnv: str = _axis) -> str:
+    return '        <BUSINTERFACE BUSNAME="{}" NAME="{}" TYPE="{}" ' \
+           'VLNV="{}"/>\n'.format(busname, name, bustype, vlnv)
+
+
+def _port(name: str, signame: str) -> str:
+    return '        <PORT NAME="{}" SIGNAME="{}"/>\n'.format(name, signame)
+
+
+def _module(fullname: str, modtype: str, vlnv: str, buses: list = None,
+            ports: list = None, parameters: dict = None) -> str:
+    text = '    <MODULE FULLNAME="{}" MODTYPE="{}" VLNV="{}">\n' \
+        .format(fullname, modtype, vlnv)
+    if parameters:
+        text += '      <PARAMETERS>\n'
+        for k, v in parameters.items():
+            text += '        <PARAMETER NAME="{}" VALUE="{}"/>\n'.format(k, v)
+        text += '      </PARAMETERS>\n'
+    if ports:
+        text += '      <PORTS>\n' + ''.join(ports) + '      </PORTS>\n'
+    if buses:
+        text += '      <BUSINTERFACES>\n' + ''.join(buses) + \
+            '      </BUSINTERFACES>\n'
+    return text + '    </MODULE>\n'
+
+
+def _fifo_chain(prefix: str, depth: int, busname: str, downstream: bool,
+                chain: tuple = ('axis_data_fifo',)) -> tuple:
+    """Insert depth modules between busname and the next module
+
+    The module types are taken from chain in round robin. Returns the modules
+    and the busname seen by the next module
+    """
+
+    modules = list()
+    for d in range(depth):
+        modtype = chain[d % len(chain)]
+        nextbus = '{}_fifo{}_out'.format(prefix, d)
+        if downstream:
+            buses = [_bus('S_AXIS', 'SLAVE', busname),
+                     _bus('M_AXIS', 'MASTER', nextbus)]
+        else:
+            buses = [_bus('M_AXIS', 'MASTER', busname),
+                     _bus('S_AXIS', 'SLAVE', nextbus)]
+        modules.append(_module('{}_fifo{}'.format(prefix, d), modtype,
+                               _chain_vlnv[modtype], buses))
+        busname = nextbus
+    return modules, busname
+
+
+def _partial_hwh(ip: str) -> str:
+    """Partial HWH with a single IP connected to stream_in0/stream_out0"""
+
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<EDKSYSTEM>\n' \
+        '  <EXTERNALINTERFACES>\n' \
+        '    <BUSINTERFACE BUSNAME="stream_in0_1" NAME="stream_in0" ' \
+        'TYPE="SLAVE"/>\n' \
+        '    <BUSINTERFACE BUSNAME="{ip}_stream_out" NAME="stream_out0" ' \
+        'TYPE="MASTER"/>\n' \
+        '  </EXTERNALINTERFACES>\n  <MODULES>\n'.format(ip=ip) + \
+        _module('/' + ip, ip, 'xilinx.com:hls:{}:1.0'.format(ip),
+                [_bus('stream_in', 'SLAVE', 'stream_in0_1'),
+                 _bus('stream_out', 'MASTER', ip + '_stream_out')]) + \
+        '  </MODULES>\n</EDKSYSTEM>\n'
+
+
+def write_overlay(directory: str, name: str = 'base',
+                  hier: str = 'composable', static: int = 2,
+                  regions: int = 1, rms: int = 2, depth: int = 0,
+                  cdc: bool = False,
+                  chain: tuple = ('axis_data_fifo',),
+                  branches: int = 0, forks: int = 1) -> str:
+    """Write a synthetic overlay and return the global HWH filename
+
+    Parameters
+    ----------
+    directory : str
+        Output directory
+    name : str
+        Bitstream name
+    hier : str
+        Hierarchy that contains the AXI4-Stream Switch
+    static : int
+        Number of static IP connected to the switch
+    regions : int
+        Number of DFX regions connected to the switch
+    rms : int
+        Number of reconfigurable modules for each DFX region
+    depth : int
+        Number of FIFOs between the switch and each IP
+    cdc : bool
+        Insert a xpm_cdc_gen between the GPIO and the decouplers
+    chain : tuple
+        Module types used in round robin for the FIFO chains, either
+        axis_data_fifo or axis_register_slice
+    branches : int
+        If not zero, add a fork_accel IP with one input and branches outputs
+        and a join_accel IP with branches inputs and one output, connected
+        to the switch ports after the DFX regions
+    forks : int
+        Number of fork_accel/join_accel pairs when branches is not zero,
+        the copies are named fork_accel_<n> and join_accel_<n>
+    """
+
+    modules = list()
+    switch = list()
+    h = '/' + hier
+    for p in range(static):
+        m_bus, s_bus = 'switch_M{:02d}'.format(p), 'switch_S{:02d}'.format(p)
+        switch += [_bus('M{:02d}_AXIS'.format(p), 'MASTER', m_bus),
+                   _bus('S{:02d}_AXIS'.format(p), 'SLAVE', s_bus)]
+        fifos, m_bus = _fifo_chain('{}/ip{}_in'.format(h, p), depth, m_bus,
+                                   True, chain)
+        modules += fifos
+        fifos, s_bus = _fifo_chain('{}/ip{}_out'.format(h, p), depth, s_bus,
+                                   False, chain)
+        modules += fifos
+        modules.append(_module('{}/ip{}_accel'.format(h, p),
+                               'ip{}_accel'.format(p),
+                               'xilinx.com:hls:ip{}_accel:1.0'.format(p),
+                               [_bus('stream_in', 'SLAVE', m_bus),
+                                _bus('stream_out', 'MASTER', s_bus)]))
+
+    concat = list()
+    for r in range(regions):
+        p = static + r
+        m_bus, s_bus = 'switch_M{:02d}'.format(p), 'switch_S{:02d}'.format(p)
+        switch += [_bus('M{:02d}_AXIS'.format(p), 'MASTER', m_bus),
+                   _bus('S{:02d}_AXIS'.format(p), 'SLAVE', s_bus)]
+        decouple, status = 'pr_{}_decouple'.format(r), 'pr_{}_status'.format(r)
+        slice_out, concat_in = decouple, status
+        if cdc:
+            slice_out, concat_in = decouple + '_cdc', status + '_cdc'
+            modules.append(_module('{}/cdc_pr_{}_decouple'.format(h, r),
+                                   'xpm_cdc_gen',
+                                   'xilinx.com:ip:xpm_cdc_gen:1.0', ports=[
+                                       _port('src_in', slice_out),
+                                       _port('dest_out', decouple)]))
+            modules.append(_module('{}/cdc_pr_{}_status'.format(h, r),
+                                   'xpm_cdc_gen',
+                                   'xilinx.com:ip:xpm_cdc_gen:1.0', ports=[
+                                       _port('src_in', status),
+                                       _port('dest_out', concat_in)]))
+        modules.append(_module('{}/xlslice_pr_{}'.format(h, r), 'xlslice',
+                               'xilinx.com:ip:xlslice:1.0',
+                               ports=[_port('Dout', slice_out)],
+                               parameters={'DIN_FROM': r, 'DIN_TO': r}))
+        concat.append(_port('In{}'.format(r), concat_in))
+        rp_in, rp_out = 'pr_{}_rp_in'.format(r), 'pr_{}_rp_out'.format(r)
+        modules.append(_module(
+            '{}/dfx_decoupler_pr_{}'.format(h, r), 'dfx_decoupler',
+            'xilinx.com:ip:dfx_decoupler:1.0',
+            [_bus('s_in_0', 'SLAVE', m_bus), _bus('rp_in_0', 'MASTER', rp_in),
+             _bus('s_out_0', 'MASTER', s_bus),
+             _bus('rp_out_0', 'SLAVE', rp_out)],
+            [_port('decouple', decouple),
+             _port('decouple_status', status)]))
+        modules.append(_module(
+            '{}/pr_{}'.format(h, r), 'pr_{}'.format(r),
+            'xilinx.com:module_ref:pr_{}:1.0'.format(r),
+            [_bus('stream_in0', 'SLAVE', rp_in),
+             _bus('stream_out0', 'MASTER', rp_out)]))
+
+        for m in range(rms):
+            partial = os.path.join(directory, '{}_{}_pr_{}_fn{}'.format(
+                name, hier.replace('/', '_'), r, m))
+            with open(partial + '.hwh', 'w') as file:
+                file.write(_partial_hwh('fn{}_accel'.format(m)))
+            open(partial + '.bit', 'wb').close()
+
+    for k in range(forks if branches else 0):
+        suffix = '_{}'.format(k) if k else ''
+        m = s = static + regions + k * (branches + 1)
+        fork = [_bus('stream_in', 'SLAVE', 'switch_M{:02d}'.format(m))]
+        join = [_bus('stream_out', 'MASTER',
+                     'switch_S{:02d}'.format(s + branches))]
+        for b in range(branches):
+            fork.append(_bus('stream_out{}'.format(b), 'MASTER',
+                             'switch_S{:02d}'.format(s + b)))
+            join.append(_bus('stream_in{}'.format(b), 'SLAVE',
+                             'switch_M{:02d}'.format(m + 1 + b)))
+        for p in range(m, m + branches + 1):
+            switch.append(_bus('M{:02d}_AXIS'.format(p), 'MASTER',
+                               'switch_M{:02d}'.format(p)))
+            switch.append(_bus('S{:02d}_AXIS'.format(p), 'SLAVE',
+                               'switch_S{:02d}'.format(p)))
+        modules.append(_module(h + '/fork_accel' + suffix, 'fork_accel',
+                               'xilinx.com:hls:fork_accel:1.0', fork))
+        modules.append(_module(h + '/join_accel' + suffix, 'join_accel',
+                               'xilinx.com:hls:join_accel:1.0', join))
+
+    if concat:
+        modules.append(_module(h + '/xlconcat', 'xlconcat',
+                               'xilinx.com:ip:xlconcat:2.1', ports=concat))
+
+    switch.append(_bus('S_AXI_CTRL', 'SLAVE', 'switch_ctrl',
+                       'xilinx.com:interface:aximm:1.0'))
+    modules.insert(0, _module(h + '/axis_switch', 'axis_switch',
+                              'xilinx.com:ip:axis_switch:1.1', switch))
+
+    hwh = os.path.join(directory, name + '.hwh')
+    with open(hwh, 'w') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<EDKSYSTEM>\n'
+                   '  <EXTERNALINTERFACES/>\n  <MODULES>\n')
+        file.write(''.join(modules))
+        file.write('  </MODULES>\n</EDKSYSTEM>\n')
+    return hwh
+
+
+def synthetic_composable(hwh: str, switch, hier: str = 'composable',
+                         lazy: bool = False):
+    """Composable object for a synthetic overlay without hardware
+
+    The discovery runs on the HWH file like Composable.__init__ does, switch
+    stands in for the AXI4-Stream Switch driver and must have max_slots and
+    a pi property. There is no soft reset
+
+    Parameters
+    ----------
+    hwh : str
+        Global HWH file, see write_overlay
+    switch : object
+        AXI4-Stream Switch driver stand-in
+    hier : str
+        Hierarchy that contains the AXI4-Stream Switch
+    lazy : bool
+        Discover the DFX regions lazily
+    """
+
+    from pynq_composable.composable import Composable
+    from pynq_composable.parser import HWHComposable
+
+    cpipe = object.__new__(Composable)
+    cpipe._ol = None
+    cpipe._hier = hier + '/'
+    cpipe._hwh_name = hwh
+    cpipe._switch = switch
+    cpipe._max_slots = switch.max_slots
+    cpipe._soft_reset = None
+    cpipe._parser = HWHComposable(hwh, hier + '/axis_switch', workers=1,
+                                  lazy=lazy)
+    cpipe._c_dict = cpipe._parser.c_dict
+    cpipe._dfx_dict = cpipe._parser.dfx_dict
+    cpipe._paths = dict()
+    cpipe._default_paths()
+    cpipe._init_state()
+    return cpipe
@@ -0,0 +1,101 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+import json
+import os
+from pynq_composable import cache, parser
+from .hwh_generator import write_overlay
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+
+_payload = {
+    'digest': 'abfc5bcafc0f55bbb4ff932fd70afc8d',
+    'signature': [1024, 1633000000000000000, 42],
+    'static_dict': {
+        'pixel_unpack': {'ci': [0], 'dfx': False, 'loaded': True,
+                         'modtype': 'pixel_unpack'},
+        'filter2d_accel': {'ci': [3], 'pi': [2], 'dfx': False,
+                           'loaded': True, 'modtype': 'filter2d_accel'}
+    },
+    'default_dfx_dict': {
+        'pr_0/stream_in0': {'pi': [6, 7], 'dfx': True, 'loaded': False,
+                            'modtype': None,
+                            'decoupler': '/pipeline0/dfx_decoupler_pr_0'}
+    },
+    'regions': {
+        'pr_0': {'decoupler': '/pipeline0/dfx_decoupler_pr_0',
+                 'decouple': 0, 'status': 0}
+    },
+    'partials': {}
+}
+
+
+def test_roundtrip(tmp_path):
+    basename = str(tmp_path / "base_pipeline0")
+    cache.save(basename, _payload)
+    assert cache.load(basename) == _payload
+    assert os.listdir(str(tmp_path)) == ['base_pipeline0.json']
+
+
+def test_version(tmp_path):
+    basename = str(tmp_path / "base_pipeline0")
+    cache.save(basename, _payload)
+    with open(basename + '.json') as file:
+        document = json.load(file)
+    document['version'] = cache.CACHE_VERSION + 1
+    with open(basename + '.json', 'w') as file:
+        json.dump(document, file)
+    assert cache.load(basename) is None
+
+
+def test_missing(tmp_path):
+    basename = str(tmp_path / "base_pipeline0")
+    assert cache.load(basename) is None
+    cache.save(basename, _payload)
+    cache.remove(basename)
+    assert cache.load(basename) is None
+
+
+def test_cache_dir(cache_dir, monkeypatch):
+    assert cache.cache_dir() == str(cache_dir)
+    assert os.path.dirname(cache.cache_path('a/base.hwh', 'pipeline0')) == \
+        str(cache_dir)
+    assert cache.cache_path('a/base.hwh', 'pipeline0') != \
+        cache.cache_path('b/base.hwh', 'pipeline0')
+    monkeypatch.delenv('PYNQ_COMPOSABLE_CACHE_DIR')
+    monkeypatch.setenv('XDG_CACHE_HOME', '/var/cache')
+    assert cache.cache_dir() == '/var/cache/pynq_composable'
+
+
+def test_eviction(cache_dir, monkeypatch):
+    names = [str(cache_dir / "base_pipeline{}".format(i)) for i in range(3)]
+    for i, name in enumerate(names):
+        cache.save(name, _payload)
+        os.utime(name + '.json', (i, i))
+    size = cache.cache_info().currsize // 3
+    cache.load(names[0])
+
+    monkeypatch.setenv('PYNQ_COMPOSABLE_CACHE_SIZE', str(2 * size))
+    cache.evict()
+    assert [e.name for e in cache.cache_info().entries] == \
+        [names[2], names[0]]
+
+
+def test_cache_info(tmp_path):
+    cache.clear()
+    hwh = write_overlay(str(tmp_path))
+    switch = "composable/axis_switch"
+    parser.HWHComposable(hwh, switch, workers=1)
+    parser.HWHComposable(hwh, switch, workers=1)
+    info = cache.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+    assert [e.name for e in info.entries] == \
+        [cache.cache_path(hwh, 'composable')]
+    assert info.currsize == info.entries[0].size
+    cache.clear()
+    assert cache.cache_info().entries == []
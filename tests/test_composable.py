@@ -0,0 +1,418 @@
+# Copyright (C) 2021 Xilinx, Inc
+#
+# SPDX-License-Identifier: BSD-3-Clause
+
+
+from collections import OrderedDict
+import numpy as np
+import pytest
+import threading
+from pynq_composable import composable, libs
+from pynq_composable.composable import Composable, UnloadedIP
+from .hwh_generator import synthetic_composable, write_overlay
+
+__author__ = "Mario Ruiz"
+__copyright__ = "Copyright 2021, Xilinx"
+__email__ = "pynq_support@xilinx.com"
+
+
+class MockSwitch:
+    """AXI4-Stream Switch driver that records the configurations"""
+
+    def __init__(self, max_slots: int = 9):
+        self.max_slots = max_slots
+        self.writes = list()
+
+    @property
+    def pi(self):
+        if not self.writes:
+            return np.ones(self.max_slots, dtype=np.int64) * -1
+        return self.writes[-1]
+
+    @pi.setter
+    def pi(self, value):
+        self.writes.append(np.copy(value))
+
+
+class MockIP:
+    """IP object that counts how many times it was started"""
+
+    def __init__(self, fullpath: str):
+        self._fullpath = fullpath
+        self.started = 0
+
+    def start(self):
+        self.started += 1
+
+
+def _composable(hwh: str, max_slots: int = 9, lazy: bool = False) \
+        -> Composable:
+    """Composable object for a synthetic overlay without hardware"""
+
+    return synthetic_composable(hwh, MockSwitch(max_slots), lazy=lazy)
+
+
+class MockConfigIP(MockIP):
+    """IP object with a configuration fingerprint that can be stopped"""
+
+    def __init__(self, fullpath: str):
+        super().__init__(fullpath)
+        self.config = 0
+        self.running = False
+
+    def start(self):
+        super().start()
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def _fingerprint(self):
+        return (self.running, self.config)
+
+
+class MockVisionIP(MockConfigIP):
+    """IP object that takes the image resolution like VitisVisionIP"""
+
+    cols = rows = None
+
+    def _resolution(self):
+        return libs.get_resolution(self._fullpath)
+
+    def _fingerprint(self):
+        return self._resolution() + super()._fingerprint()
+
+
+class MockGPIO:
+    """GPIO pin that records the values written"""
+
+    def __init__(self):
+        self.writes = list()
+
+    def write(self, value):
+        self.writes.append(value)
+
+
+@pytest.fixture(params=[False, True], ids=['eager', 'lazy'])
+def cpipe(tmp_path, request):
+    hwh = write_overlay(str(tmp_path), static=4, regions=2, rms=2,
+                        branches=2)
+    yield _composable(hwh, lazy=request.param)
+
+
+@pytest.fixture
+def ips():
+    """IP objects of the synthetic overlay by name"""
+
+    names = ['ip0_accel', 'ip1_accel', 'ip2_accel', 'ip3_accel',
+             'fork_accel', 'join_accel', 'pr_0/fn0_accel']
+    yield {n: MockIP('composable/' + n) for n in names}
+
+
+def test_register_rm(cpipe, tmp_path):
+    cpipe._resolve()
+    cpipe._c_dict['pr_0/fn0_accel']['loaded'] = True
+    with open(tmp_path / "base_composable_pr_0_fn0.hwh") as file:
+        content = file.read().replace('fn0_accel', 'fn2_accel')
+    with open(tmp_path / "base_composable_pr_0_fn2.hwh", "w") as file:
+        file.write(content)
+    open(tmp_path / "base_composable_pr_0_fn2.bit", 'wb').close()
+
+    c_dict = {k: dict(v) for k, v in cpipe._c_dict.items()}
+    cpipe.register_rm('pr_0', "base_composable_pr_0_fn2.bit")
+    assert cpipe._c_dict['pr_0/fn2_accel']['loaded'] is False
+    assert 'base_composable_pr_0_fn2.bit' in cpipe._dfx_dict['pr_0']['rm']
+    assert {k: v for k, v in cpipe._c_dict.items()
+            if k != 'pr_0/fn2_accel'} == c_dict
+
+    cpipe.register_rm('pr_0', "base_composable_pr_0_fn0.bit")
+    assert cpipe._c_dict['pr_0/fn0_accel']['loaded'] is True
+
+
+def test_lazy_resolution(cpipe):
+    ip = cpipe.pr_1.fn0_accel
+    assert isinstance(ip, UnloadedIP)
+    assert ip._fullpath == 'pr_1/fn0_accel'
+    assert 'pr_1/fn1_accel' in cpipe._c_dict
+    assert cpipe._relative_path('composable/pr_0/fn1_accel') == \
+        'pr_0/fn1_accel'
+    assert 'pr_0/fn1_accel' in cpipe._c_dict
+    assert cpipe._parser.pending == []
+
+
+def test_compose(cpipe, ips):
+    a, b, c, d, fork, join = [ips[n] for n in list(ips)[:6]]
+    cpipe.compose([a, fork, [[b], [c]], join, d])
+    assert cpipe._switch.pi.tolist() == [-1, 6, 7, 8, -1, -1, 0, 1, 2]
+    assert cpipe._current_flat_pipeline == [a, fork, b, c, join, d]
+    assert 'fork_accel -> ip2_accel' in cpipe.graph.source
+    assert [ip.started for ip in [a, fork, b, c, join, d]] == [1] * 6
+
+    cpipe.compose([a, fork, [[b, c], [1]], join, d])
+    assert cpipe._switch.pi.tolist() == [-1, 6, 1, 8, -1, -1, 0, 2, 7]
+
+
+def test_compose_plan_cache(cpipe, ips, monkeypatch):
+    a, b, c, d = [ips[n] for n in list(ips)[:4]]
+    pipelines = [[a, b, c], [a, c, d]]
+    for pipeline in pipelines:
+        cpipe.compose(pipeline)
+    graph = cpipe.graph.source
+
+    monkeypatch.setattr(Composable, '_relative_path', None)
+    for pipeline in pipelines * 2:
+        cpipe.compose(list(pipeline))
+    assert len(cpipe._switch.writes) == 6
+    assert cpipe._switch.pi.tolist() == [-1, -1, 0, 2, -1, -1, -1, -1, -1]
+    assert cpipe.graph.source == graph
+    assert a.started == 6
+    with pytest.raises(ValueError):
+        cpipe._plans[next(iter(cpipe._plans))].switch_conf[0] = 1
+
+
+def test_compose_unloaded(cpipe, ips):
+    a = ips['ip0_accel']
+    with pytest.raises(AttributeError):
+        cpipe.compose([a, UnloadedIP('composable/pr_1/fn0_accel')])
+    assert cpipe._switch.writes == []
+    assert a.started == 0
+    assert cpipe._plans == OrderedDict()
+
+
+def test_compose_nested(tmp_path):
+    hwh = write_overlay(str(tmp_path), static=5, regions=0, branches=2,
+                        forks=2)
+    cpipe = _composable(hwh, max_slots=11)
+    a, b, c, d, e, f0, j0, f1, j1 = [MockIP('composable/' + n) for n in [
+        'ip0_accel', 'ip1_accel', 'ip2_accel', 'ip3_accel', 'ip4_accel',
+        'fork_accel', 'join_accel', 'fork_accel_1', 'join_accel_1']]
+
+    cpipe.compose([a, f0, [[b, f1, [[c], [1]], j1], [1]], j0, d])
+    assert cpipe._switch.pi.tolist() == [-1, 5, 8, 7, -1, 0, 10, 6, 1, 2, 9]
+    assert cpipe._current_flat_pipeline == [a, f0, b, f1, c, j1, j0, d]
+
+    cpipe.replace((c, e))
+    assert cpipe._current_pipeline[2][0][2][0] == [e]
+    assert cpipe._switch.pi.tolist() == [-1, 5, -1, 7, 8, 0, 10, 6, 1, 4, 9]
+    with pytest.raises(SystemError, match="already being used"):
+        cpipe.compose([a, f0, [[b], [c]], j0, b])
+    with pytest.raises(SystemError, match="2 input"):
+        cpipe.compose([[[b]], j0, d])
+
+
+def test_graph_lazy(cpipe, ips, monkeypatch):
+    a, b, c = [ips[n] for n in list(ips)[:3]]
+    built = list()
+    plan_graph = composable._plan_graph
+    monkeypatch.setattr(composable, '_plan_graph',
+                        lambda *args: built.append(args) or plan_graph(*args))
+    for pipeline in [[a, b, c], [a, c], [a, b, c]]:
+        cpipe.compose(pipeline)
+    assert built == []
+
+    graph = cpipe.graph
+    assert cpipe.graph is graph
+    assert 'ip0_accel -> ip1_accel' in graph.source
+    assert len(built) == 1
+
+    graph.graph_attr['rankdir'] = 'BT'
+    cpipe.compose([a, c])
+    cpipe._graph_debug = True
+    assert 'rankdir=BT' in cpipe.graph.source
+    assert 'color="green"' in cpipe.graph.source
+    assert len(built) == 2
+
+
+def test_plan(cpipe, ips):
+    a, b, c, d, fork, join = [ips[n] for n in list(ips)[:6]]
+    cpipe._sw_default[5] = 4
+    result = cpipe.plan([a, fork, [[b], [c]], join, d])
+    assert result.errors == tuple()
+    assert result.switch_conf.tolist() == [-1, 6, 7, 8, -1, 4, 0, 1, 2]
+    assert result.start == (a, fork, b, c, join, d)
+    assert result.free_ci == (3, 5)
+    assert result.free_pi == (0, 4)
+    assert cpipe._switch.writes == []
+    assert [ip.started for ip in result.start] == [0] * 6
+
+    cpipe.compose([a, fork, [[b], [c]], join, d])
+    assert np.array_equal(cpipe._switch.pi, result.switch_conf)
+
+    result = cpipe.plan([a, b, c, b])
+    assert result.switch_conf is None
+    assert isinstance(result.errors[0], SystemError)
+    result = cpipe.plan([a, UnloadedIP('composable/pr_1/fn0_accel')])
+    assert isinstance(result.errors[0], AttributeError)
+
+
+def test_plan_thread(cpipe, ips, monkeypatch):
+    monkeypatch.setattr(composable, '_plan_cache_size', 2)
+    a, b, c, d = [ips[n] for n in list(ips)[:4]]
+    pipelines = [[a, b], [b, c], [c, d], [d, a], [a, c, d]]
+    errors = list()
+
+    def planner():
+        for _ in range(200):
+            for pipeline in pipelines:
+                errors.extend(cpipe.plan(pipeline).errors)
+
+    threads = [threading.Thread(target=planner) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(200):
+        cpipe.compose([a, b, c])
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(cpipe._plans) <= 2
+
+
+def test_compose_restart(cpipe):
+    a, b, c = [MockConfigIP('composable/ip{}_accel'.format(i))
+               for i in range(3)]
+    cpipe.compose([a, b, c])
+    cpipe.compose([a, b, c])
+    assert [ip.started for ip in [a, b, c]] == [1, 1, 1]
+
+    b.config = 1
+    cpipe.compose([a, b, c])
+    assert [ip.started for ip in [a, b, c]] == [1, 2, 1]
+
+    cpipe.compose([a, c])
+    assert [ip.started for ip in [a, b, c]] == [2, 2, 2]
+    cpipe.compose([a, b, c])
+    assert [ip.started for ip in [a, b, c]] == [3, 3, 3]
+
+    b.stop()
+    cpipe.compose([a, b, c])
+    assert [ip.started for ip in [a, b, c]] == [3, 4, 3]
+    cpipe.compose([a, b, c])
+    assert [ip.started for ip in [a, b, c]] == [3, 4, 3]
+
+
+def test_resolution(cpipe, tmp_path):
+    a, b = [MockVisionIP('composable/ip{}_accel'.format(i)) for i in range(2)]
+    other = MockVisionIP('other/ip0_accel')
+    with open(libs._resolution_file, 'w') as file:
+        file.write('{"width": 320, "height": 240}')
+    assert libs.get_resolution('other') == (320, 240)
+    libs.set_resolution(1280, 720)
+    assert cpipe.resolution == (1280, 720)
+
+    cpipe.compose([a, b])
+    cpipe.resolution = (640, 480)
+    assert (a.cols, a.rows, b.cols, b.rows) == (640, 480, 640, 480)
+    assert other._resolution() == (1280, 720)
+    assert a._resolution() == (640, 480)
+    cpipe.compose([a, b])
+    assert a.started == b.started == 1
+
+    libs.clear_resolution()
+    libs.clear_resolution('composable')
+    (tmp_path / 'resolution.json').unlink()
+    assert cpipe.resolution == (320, 240)
+
+
+def test_reset_policy(cpipe, monkeypatch):
+    a, b, c = [MockConfigIP('composable/ip{}_accel'.format(i))
+               for i in range(3)]
+    gpio = MockGPIO()
+    cpipe._soft_reset = [gpio]
+    cpipe.compose([a, b, c])
+    assert gpio.writes == [1, 0]
+
+    b.config = 1
+    cpipe.compose([a, b, c])
+    assert gpio.writes == [1, 0]
+    assert len(cpipe._switch.writes) == 1
+    assert [ip.started for ip in [a, b, c]] == [1, 2, 1]
+
+    cpipe.compose([a, c])
+    assert gpio.writes == [1, 0] * 2
+    assert [ip.started for ip in [a, b, c]] == [2, 2, 2]
+
+    expected = cpipe._switch.pi
+    cpipe._switch.pi = np.arange(9, dtype=np.int64)
+    cpipe.compose([a, c])
+    assert gpio.writes == [1, 0] * 3
+    assert np.array_equal(cpipe._switch.pi, expected)
+    assert [ip.started for ip in [a, b, c]] == [3, 2, 3]
+
+    monkeypatch.setattr(Composable, 'reset_policy', 'always')
+    cpipe.compose([a, c])
+    assert gpio.writes == [1, 0] * 4
+    assert [ip.started for ip in [a, b, c]] == [4, 2, 4]
+    assert len(cpipe._switch.writes) == 4
+
+
+def test_edit(tmp_path):
+    hwh = write_overlay(str(tmp_path), static=12, regions=0)
+    cpipe = _composable(hwh, max_slots=12)
+    gpio = MockGPIO()
+    cpipe._soft_reset = [gpio]
+    ip = [MockConfigIP('composable/ip{}_accel'.format(i)) for i in range(12)]
+    cpipe.compose(ip[:10])
+    assert gpio.writes == [1, 0]
+
+    cpipe.replace((ip[5], ip[10]))
+    assert gpio.writes == [1, 0] * 2
+    changed = np.flatnonzero(cpipe._switch.writes[-1] !=
+                             cpipe._switch.writes[-2])
+    assert list(changed) == [5, 6, 10]
+    assert [i.started for i in ip] == [2] * 5 + [1] + [2] * 4 + [1, 0]
+
+    cpipe.insert(([ip[11]], 3))
+    cpipe.remove([ip[11]])
+    assert gpio.writes == [1, 0] * 4
+    assert cpipe._switch.writes[-1][3] == 2
+    assert cpipe._current_flat_pipeline == ip[:5] + [ip[10]] + ip[6:10]
+
+    ip[7].config = 1
+    cpipe.replace((ip[10], ip[10]))
+    assert gpio.writes == [1, 0] * 4
+    assert [i.started for i in ip] == [4] * 5 + [1, 4, 5, 4, 4, 3, 1]
+
+
+def test_edit_policy(tmp_path, monkeypatch):
+    monkeypatch.setattr(Composable, 'reset_policy', 'edits')
+    hwh = write_overlay(str(tmp_path), static=12, regions=0)
+    cpipe = _composable(hwh, max_slots=12)
+    gpio = MockGPIO()
+    cpipe._soft_reset = [gpio]
+    ip = [MockConfigIP('composable/ip{}_accel'.format(i)) for i in range(12)]
+    cpipe.compose(ip[:10])
+    assert gpio.writes == [1, 0]
+
+    cpipe.replace((ip[5], ip[10]))
+    assert gpio.writes == [1, 0]
+    changed = np.flatnonzero(cpipe._switch.writes[-1] !=
+                             cpipe._switch.writes[-2])
+    assert list(changed) == [5, 6, 10]
+    assert [i.started for i in ip] == [1] * 4 + [2, 1, 2] + [1] * 3 + [1, 0]
+
+    cpipe.insert(([ip[11]], 3))
+    cpipe.remove([ip[11]])
+    assert gpio.writes == [1, 0]
+    assert cpipe._current_flat_pipeline == ip[:5] + [ip[10]] + ip[6:10]
+    assert [i.started for i in ip] == [1, 1, 3, 3, 2, 1, 2] + [1] * 5
+
+    cpipe.compose(ip[:10])
+    assert gpio.writes == [1, 0] * 2
+
+
+def test_load_region_prefix(tmp_path, monkeypatch):
+    hwh = write_overlay(str(tmp_path), static=2, regions=11, rms=1)
+    cpipe = _composable(hwh, max_slots=16)
+    cpipe._bitfile = hwh.replace('.hwh', '.bit')
+    cpipe._dfx_control = [MockGPIO() for _ in range(11)]
+    downloads = list()
+    monkeypatch.setattr(cpipe, '_pr_download',
+                        lambda pr, bit: downloads.append((pr, bit)))
+    cpipe.loadIP(['pr_10/fn0_accel', 'pr_1/fn0_accel'])
+    assert downloads == [
+        ('pr_10', str(tmp_path / 'base_composable_pr_10_fn0.bit')),
+        ('pr_1', str(tmp_path / 'base_composable_pr_1_fn0.bit'))]
+
+    cpipe._c_dict['pr_10/fn0_accel']['loaded'] = True
+    cpipe._unload_region_from_ip_dict('pr_1')
+    assert cpipe._c_dict['pr_10/fn0_accel']['loaded']
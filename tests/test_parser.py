@@ -5,9 +5,12 @@
 
 import pytest
 import hashlib
+import os
 import pickle as pkl
+import shutil
 import sys
-from pynq_composable import parser
+from pynq_composable import cache, parser
+from .hwh_generator import write_overlay
 
 __author__ = "Mario Ruiz"
 __copyright__ = "Copyright 2021, Xilinx"
@@ -28,6 +31,13 @@ with open(hwhfilename, 'rb') as file:
     hwhdigest = hashlib.md5(file.read()).hexdigest()
 
 
+@pytest.fixture
+def hwhfile(tmp_path):
+    """Copy of the HWH file so cache files do not overwrite the fixtures"""
+
+    yield shutil.copy(hwhfilename, tmp_path)
+
+
 def test_file():
     filename = 'nofile.hwh'
     with pytest.raises(FileNotFoundError) as fileinfo:
@@ -44,17 +54,450 @@ def test_bad_switch():
         "AXI4-Switch {} does not exist in the hwh file".format(switch)
 
 
-def test_switch0():
+def test_switch0(hwhfile):
     switch = "pipeline0/axis_switch"
-    hwhparser = parser.HWHComposable(hwhfilename, switch, False)
+    hwhparser = parser.HWHComposable(hwhfile, switch, False)
     assert _c_dict0 == hwhparser.c_dict
     assert _dfx_dict0 == hwhparser.dfx_dict
     assert hwhdigest == _cached_digest0
 
 
-def test_switch1():
+def test_switch1(hwhfile):
     switch = "pipeline1/axis_switch"
-    hwhparser = parser.HWHComposable(hwhfilename, switch, False)
+    hwhparser = parser.HWHComposable(hwhfile, switch, False)
     assert _c_dict1 == hwhparser.c_dict
     assert _dfx_dict1 == hwhparser.dfx_dict
     assert hwhdigest == _cached_digest1
+
+
+def test_connectivity_index():
+    tree = parser.ElementTree.parse(hwhfilename)
+    index = parser._ConnectivityIndex(tree)
+    switch = index.module('/pipeline0/axis_switch')
+    assert switch.get('MODTYPE') == 'axis_switch'
+    assert index.module('/nomodule') is None
+    for bus in switch.iterfind('BUSINTERFACES/*'):
+        busname = bus.get('BUSNAME')
+        search_term = "MODULES/*BUSINTERFACES/*/[@BUSNAME=\'" + \
+            busname + "\']....."
+        assert [m for m, _ in index.connected(busname)] == \
+            tree.findall(search_term)
+
+
+def test_hwh_document():
+    document = parser._HWHDocument(hwhfilename)
+    assert document.digest == hwhdigest
+    assert document.index is document.index
+    assert document.tree.getroot().tag == 'EDKSYSTEM'
+
+
+def test_timing(hwhfile):
+    switch = "pipeline0/axis_switch"
+    hwhparser = parser.HWHComposable(hwhfile, switch, False)
+    assert list(hwhparser.timing) == ['parse', 'hardware', 'dfx_regions',
+                                      'partial_bitstreams', 'dfx_ip']
+
+
+def test_discover_switches(hwhfile, monkeypatch):
+    reads = list()
+    read = parser._HWHDocument._read
+
+    def _counting_read(self, parse):
+        reads.append(parse)
+        read(self, parse)
+
+    monkeypatch.setattr(parser._HWHDocument, '_read', _counting_read)
+    switches = parser.discover_switches(hwhfile, False)
+    assert reads == [True]
+    assert list(switches) == ["pipeline0/axis_switch",
+                              "pipeline1/axis_switch"]
+    assert switches["pipeline0/axis_switch"].c_dict == _c_dict0
+    assert switches["pipeline0/axis_switch"].dfx_dict == _dfx_dict0
+    assert switches["pipeline1/axis_switch"].c_dict == _c_dict1
+    assert switches["pipeline1/axis_switch"].dfx_dict == _dfx_dict1
+
+
+def test_stale_signature_single_read(hwhfile, monkeypatch):
+    switch = "pipeline0/axis_switch"
+    parser.HWHComposable(hwhfile, switch, workers=1)
+    reads = list()
+    read = parser._HWHDocument._read
+
+    def _counting_read(self, parse):
+        reads.append(parse)
+        read(self, parse)
+
+    monkeypatch.setattr(parser._HWHDocument, '_read', _counting_read)
+    os.utime(hwhfile)
+    hwhparser = parser.HWHComposable(hwhfile, switch, workers=1)
+    assert reads == [True]
+    assert 'hardware' not in hwhparser.timing
+
+    with open(hwhfile, "a") as file:
+        file.write("<!-- rebuilt -->\n")
+    hwhparser = parser.HWHComposable(hwhfile, switch, workers=1)
+    assert reads == [True, True]
+    assert 'hardware' in hwhparser.timing
+    assert hwhparser.c_dict == _c_dict0
+
+
+@pytest.mark.parametrize("switch, c_dict, dfx_dict",
+                         [("pipeline0/axis_switch", _c_dict0, _dfx_dict0),
+                          ("pipeline1/axis_switch", _c_dict1, _dfx_dict1)])
+def test_streaming(hwhfile, switch, c_dict, dfx_dict):
+    hwhparser = parser.HWHComposable(hwhfile, switch, False, True)
+    assert c_dict == hwhparser.c_dict
+    assert dfx_dict == hwhparser.dfx_dict
+
+
+def test_streaming_prunes_tree():
+    document = parser._HWHDocument(hwhfilename, streaming=True)
+    assert document.digest == hwhdigest
+    root = document.tree.getroot()
+    assert [c.tag for c in root] == ['EXTERNALINTERFACES', 'MODULES']
+    assert root.find('MODULES/*/PORTS/*/CONNECTIONS') is None
+    assert root.find('MODULES/*/BUSINTERFACES/*/PORTMAPS') is None
+
+
+_partial_template = """<?xml version="1.0" encoding="UTF-8"?>
+<EDKSYSTEM>
+  <EXTERNALINTERFACES>
+    <BUSINTERFACE BUSNAME="stream_in0_1" NAME="stream_in0" TYPE="SLAVE"/>
+    <BUSINTERFACE BUSNAME="{ip}_stream_out" NAME="stream_out0"
+                  TYPE="MASTER"/>
+  </EXTERNALINTERFACES>
+  <MODULES>
+    <MODULE FULLNAME="/{ip}" MODTYPE="{ip}" VLNV="xilinx.com:hls:{ip}:1.0">
+      <BUSINTERFACES>
+        <BUSINTERFACE BUSNAME="stream_in0_1" NAME="stream_in" TYPE="SLAVE"
+                      VLNV="xilinx.com:interface:axis:1.0"/>
+        <BUSINTERFACE BUSNAME="{ip}_stream_out" NAME="stream_out"
+                      TYPE="MASTER" VLNV="xilinx.com:interface:axis:1.0"/>
+      </BUSINTERFACES>
+    </MODULE>
+  </MODULES>
+</EDKSYSTEM>
+"""
+
+
+def test_discover_partials(tmp_path):
+    jobs = list()
+    for region in ['pr_0', 'pr_1']:
+        for ip in ['dilate_accel', 'erode_accel', 'fast_accel']:
+            hwh = tmp_path / "base_composable_{}_{}.hwh".format(region, ip)
+            hwh.write_text(_partial_template.format(ip=ip))
+            jobs.append((region, str(hwh)))
+    sequential = parser._discover_partials(jobs, 1)
+    assert sequential == parser._discover_partials(jobs, 4)
+    signature, digest, dfx_dict = sequential[1]
+    assert signature == parser._file_signature(jobs[1][1])
+    assert digest == parser._file_digest(jobs[1][1])
+    assert dfx_dict == {
+        'pr_0/erode_accel': {
+            'interface': ['/pr_0/stream_in0', '/pr_0/stream_out0'],
+            'modtype': 'erode_accel',
+            'bitstream': str(tmp_path / "base_composable_pr_0_erode_accel.bit")
+        }
+    }
+
+
+def test_partial_cache(tmp_path, monkeypatch):
+    hwh = write_overlay(str(tmp_path), regions=2, rms=3)
+    switch = "composable/axis_switch"
+    reference = parser.HWHComposable(hwh, switch, workers=1)
+
+    parsed = list()
+    discovery = parser._dfx_ip_discovery
+
+    def _counting_discovery(partial_region, partial_hwh, tree=None):
+        parsed.append(os.path.basename(partial_hwh))
+        return discovery(partial_region, partial_hwh, tree)
+
+    monkeypatch.setattr(parser, '_dfx_ip_discovery', _counting_discovery)
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert parsed == []
+    assert 'parse' not in hwhparser.timing
+    assert hwhparser.c_dict == reference.c_dict
+    assert hwhparser.dfx_dict == reference.dfx_dict
+
+    with open(tmp_path / "base_composable_pr_1_fn2.hwh", "a") as file:
+        file.write("<!-- rebuilt -->\n")
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert parsed == ["base_composable_pr_1_fn2.hwh"]
+    assert hwhparser.c_dict == reference.c_dict
+
+    os.remove(tmp_path / "base_composable_pr_0_fn0.bit")
+    os.remove(tmp_path / "base_composable_pr_0_fn0.hwh")
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert parsed == ["base_composable_pr_1_fn2.hwh"]
+    assert 'pr_0/fn0_accel' not in hwhparser.c_dict
+    assert 'base_composable_pr_0_fn0.bit' not in \
+        hwhparser.dfx_dict['pr_0']['rm']
+
+
+def test_cache_signature(tmp_path, monkeypatch):
+    hwh = write_overlay(str(tmp_path), regions=2, rms=2)
+    switch = "composable/axis_switch"
+    reference = parser.HWHComposable(hwh, switch, workers=1)
+
+    hashed = list()
+    digest = parser._file_digest
+
+    def _counting_digest(filename):
+        hashed.append(os.path.basename(filename))
+        return digest(filename)
+
+    monkeypatch.setattr(parser, '_file_digest', _counting_digest)
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert hashed == []
+    assert 'digest' not in hwhparser.timing
+    assert hwhparser.c_dict == reference.c_dict
+
+    stat = os.stat(hwh)
+    os.utime(hwh, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert 'parse' in hwhparser.timing
+    assert 'hardware' not in hwhparser.timing
+    assert hwhparser.c_dict == reference.c_dict
+
+    hashed.clear()
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert hashed == []
+
+
+def test_cache_verify(tmp_path):
+    hwh = write_overlay(str(tmp_path))
+    switch = "composable/axis_switch"
+    cachefile = cache.cache_path(hwh, 'composable') + '.json'
+    parser.HWHComposable(hwh, switch, workers=1)
+
+    stat = os.stat(hwh)
+    with open(hwh, "r+") as file:
+        content = file.read()
+        file.seek(0)
+        file.write(content.replace('ip0_accel', 'ip9_accel'))
+    os.utime(hwh, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    with pytest.warns(UserWarning):
+        hwhparser = parser.HWHComposable(hwh, switch, workers=1, verify=True)
+        hwhparser._verifier.join()
+    assert 'ip0_accel' in hwhparser.c_dict
+    assert not os.path.exists(cachefile)
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert 'ip9_accel' in hwhparser.c_dict
+
+
+def test_legacy_cache(hwhfile, monkeypatch):
+    shutil.copy(pklfile0, os.path.dirname(hwhfile))
+    switch = "pipeline0/axis_switch"
+    cache.clear()
+    hwhparser = parser.HWHComposable(hwhfile, switch)
+    assert _c_dict0 == hwhparser.c_dict
+    assert _dfx_dict0 == hwhparser.dfx_dict
+    assert cache.cache_info().misses == 1
+    assert len(cache.cache_info().entries) == 1
+
+    monkeypatch.setattr(parser._HWHDocument, 'tree', None)
+    monkeypatch.setattr(parser._HWHDocument, 'digest', None)
+    hwhparser = parser.HWHComposable(hwhfile, switch)
+    assert _c_dict0 == hwhparser.c_dict
+    assert cache.cache_info().hits == 1
+    assert hwhparser.pending == []
+
+
+def test_shipped_cache(tmp_path, monkeypatch):
+    hwh = write_overlay(str(tmp_path), regions=2, rms=2)
+    switch = "composable/axis_switch"
+    reference = parser.HWHComposable(hwh, switch, False, workers=1)
+    reference._save_cache(cache.local_path(hwh, 'composable'))
+    cache.clear()
+    shipped = str(tmp_path / "base_composable.json")
+    mtime = os.stat(shipped).st_mtime_ns
+    os.utime(hwh)
+
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    assert 'hardware' not in hwhparser.timing
+    assert hwhparser.c_dict == reference.c_dict
+    assert hwhparser.dfx_dict == reference.dfx_dict
+    assert cache.cache_info().hits == 1
+    assert len(cache.cache_info().entries) == 1
+    assert os.stat(shipped).st_mtime_ns == mtime
+
+
+@pytest.mark.parametrize("depth", [0, 1, 4])
+def test_synthetic_chain(tmp_path, depth):
+    hwh = write_overlay(str(tmp_path), static=3, regions=2, rms=2,
+                        depth=depth,
+                        chain=('axis_data_fifo', 'axis_register_slice'))
+    hwhparser = parser.HWHComposable(hwh, "composable/axis_switch", False,
+                                     workers=1)
+    for p in range(3):
+        assert hwhparser.c_dict['ip{}_accel'.format(p)]['ci'] == [p]
+        assert hwhparser.c_dict['ip{}_accel'.format(p)]['pi'] == [p]
+    assert hwhparser.c_dict['pr_1/fn0_accel']['ci'] == [4]
+    assert list(hwhparser.dfx_dict) == ['pr_0', 'pr_1']
+
+
+def test_partial_bitstreams(tmp_path):
+    hwh = write_overlay(str(tmp_path), regions=11, rms=1)
+    for name in ['other_composable_pr_1_fn0.bit', 'base_composable_pr_1.bit',
+                 'base_composable_pr_11_fn0.bit', 'base_pr_1_fn0.bit',
+                 'base_composable_pr_1_fn9.bit']:
+        open(tmp_path / name, 'wb').close()
+    hwhparser = parser.HWHComposable(hwh, "composable/axis_switch", False,
+                                     workers=1)
+    assert list(hwhparser.dfx_dict['pr_1']['rm']) == \
+        ['base_composable_pr_1_fn0.bit', 'base_composable_pr_1_fn9.bit']
+    assert list(hwhparser.dfx_dict['pr_10']['rm']) == \
+        ['base_composable_pr_10_fn0.bit']
+    assert hwhparser.dfx_dict['pr_1']['rm']['base_composable_pr_1_fn9.bit'] \
+        == dict()
+
+
+@pytest.mark.parametrize("cdc", [False, True])
+def test_decoupler_gpio_pins(tmp_path, cdc):
+    hwh = write_overlay(str(tmp_path), regions=3, rms=1, cdc=cdc)
+    hwhparser = parser.HWHComposable(hwh, "composable/axis_switch", False,
+                                     workers=1)
+    for r in range(3):
+        region = hwhparser.dfx_dict['pr_{}'.format(r)]
+        assert (region['decouple'], region['status']) == (r, r)
+
+
+_cdc_loop = """<EDKSYSTEM><MODULES>
+  <MODULE FULLNAME="/cdc0" VLNV="xilinx.com:ip:xpm_cdc_gen:1.0"><PORTS>
+    <PORT NAME="src_in" SIGNAME="a"/><PORT NAME="dest_out" SIGNAME="b"/>
+  </PORTS></MODULE>
+  <MODULE FULLNAME="/cdc1" VLNV="xilinx.com:ip:xpm_cdc_gen:1.0"><PORTS>
+    <PORT NAME="src_in" SIGNAME="b"/><PORT NAME="dest_out" SIGNAME="a"/>
+  </PORTS></MODULE>
+</MODULES></EDKSYSTEM>"""
+
+
+def test_decoupler_gpio_cycle():
+    tree = parser.ElementTree.ElementTree(
+        parser.ElementTree.fromstring(_cdc_loop))
+    index = parser._ConnectivityIndex(tree)
+    assert [m.get('FULLNAME') for m, _ in index.ports('a')] == \
+        ['/cdc0', '/cdc1']
+    assert parser._get_dfxdecoupler_decouple_gpio_pin('a', index) is None
+    assert parser._get_dfxdecoupler_status_gpio_pin('a', index) is None
+
+
+def test_register_rm(tmp_path, monkeypatch):
+    hwh = write_overlay(str(tmp_path), regions=2, rms=2)
+    switch = "composable/axis_switch"
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1)
+    reference = dict(hwhparser.c_dict)
+
+    bitname = "base_composable_pr_1_fn7.bit"
+    with open(tmp_path / "base_composable_pr_1_fn7.hwh", "w") as file:
+        file.write(_partial_template.format(ip='fn7_accel'))
+    open(tmp_path / bitname, 'wb').close()
+
+    with pytest.raises(ValueError):
+        hwhparser.register_rm('pr_9', bitname)
+    with pytest.raises(ValueError):
+        hwhparser.register_rm('pr_0', bitname)
+    with pytest.raises(FileNotFoundError):
+        hwhparser.register_rm('pr_1', "base_composable_pr_1_fn8.bit")
+
+    dfx_dict = hwhparser.register_rm('pr_1', str(tmp_path / bitname))
+    assert list(dfx_dict) == ['pr_1/fn7_accel']
+    assert hwhparser.dfx_dict['pr_1']['rm'][bitname] == dfx_dict
+    assert hwhparser.c_dict['pr_1/fn7_accel'] == {
+        'ci': [3], 'pi': [3], 'modtype': 'fn7_accel',
+        'bitstream': str(tmp_path / bitname), 'dfx': True, 'loaded': False}
+    for k, v in reference.items():
+        assert hwhparser.c_dict[k] == v
+
+    parsed = list()
+    monkeypatch.setattr(parser, '_dfx_ip_discovery',
+                        lambda r, h, t=None: parsed.append(h))
+    restored = parser.HWHComposable(hwh, switch, workers=1)
+    assert parsed == []
+    assert restored.c_dict == hwhparser.c_dict
+    assert restored.dfx_dict == hwhparser.dfx_dict
+
+
+def test_lazy(tmp_path, monkeypatch):
+    hwh = write_overlay(str(tmp_path), regions=3, rms=2)
+    switch = "composable/axis_switch"
+    reference = parser.HWHComposable(hwh, switch, False, workers=1)
+    cache.clear()
+
+    parsed = list()
+    discovery = parser._dfx_ip_discovery
+
+    def _counting_discovery(partial_region, partial_hwh, tree=None):
+        parsed.append(partial_region)
+        return discovery(partial_region, partial_hwh, tree)
+
+    monkeypatch.setattr(parser, '_dfx_ip_discovery', _counting_discovery)
+    hwhparser = parser.HWHComposable(hwh, switch, workers=1, lazy=True)
+    assert parsed == []
+    assert hwhparser.pending == ['pr_0', 'pr_1', 'pr_2']
+    assert list(hwhparser.c_dict) == ['ip0_accel', 'ip1_accel']
+    assert hwhparser.dfx_dict['pr_1']['rm'] == {
+        'base_composable_pr_1_fn0.bit': {}, 'base_composable_pr_1_fn1.bit': {}}
+
+    assert hwhparser.resolve('pr_1') == ['pr_1/fn0_accel', 'pr_1/fn1_accel']
+    assert parsed == ['pr_1', 'pr_1']
+    assert hwhparser.pending == ['pr_0', 'pr_2']
+    assert hwhparser.dfx_dict['pr_1'] == reference.dfx_dict['pr_1']
+
+    restored = parser.HWHComposable(hwh, switch, workers=1, lazy=True)
+    assert restored.pending == ['pr_0', 'pr_2']
+    assert 'pr_1/fn0_accel' in restored.c_dict
+
+    hwhparser.resolve()
+    assert parsed == ['pr_1', 'pr_1', 'pr_0', 'pr_0', 'pr_2', 'pr_2']
+    assert hwhparser.pending == []
+    assert hwhparser.resolve() == []
+    assert hwhparser.c_dict == reference.c_dict
+    assert hwhparser.dfx_dict == reference.dfx_dict
+
+
+def test_prewarm(tmp_path):
+    overlays = [write_overlay(str(tmp_path), name=name, regions=2, rms=2)
+                for name in ['base', 'base_v2', 'other']]
+    assert parser.find_overlays(str(tmp_path)) == sorted(overlays)
+    assert parser.find_overlays(str(tmp_path / "base*.hwh")) == \
+        overlays[:2]
+    skipped = list()
+    parser.find_overlays(str(tmp_path / "other*.hwh"), skipped)
+    assert [os.path.basename(h) for h in skipped] == [
+        'other_composable_pr_{}_fn{}.hwh'.format(r, m)
+        for r in range(2) for m in range(2)]
+
+    results = parser.prewarm(overlays, 2)
+    assert [status for status, _, _ in results.values()] == \
+        ['discovered'] * 3
+    assert list(results[overlays[0]][2]) == ['composable/axis_switch']
+
+    with open(overlays[1], "a") as file:
+        file.write("<!-- rebuilt -->\n")
+    results = parser.prewarm(overlays, 1)
+    assert [status for status, _, _ in results.values()] == \
+        ['cached', 'discovered', 'cached']
+    assert 'parse' not in results[overlays[0]][2]['composable/axis_switch']
+
+
+def test_find_overlays_variant(tmp_path, monkeypatch):
+    overlays = [write_overlay(str(tmp_path), name=name, regions=1, rms=1)
+                for name in ['base', 'base_zu_rev_b']]
+    monkeypatch.setattr(parser, '_stream_chunk', 7)
+    skipped = list()
+    assert parser.find_overlays(str(tmp_path), skipped) == overlays
+    assert [os.path.basename(h) for h in skipped] == [
+        'base_composable_pr_0_fn0.hwh',
+        'base_zu_rev_b_composable_pr_0_fn0.hwh']
+
+
+def test_prewarm_missing_switch(hwhfile):
+    parser.HWHComposable(hwhfile, "pipeline0/axis_switch", workers=1)
+    results = parser.prewarm([hwhfile], 1)
+    assert results[hwhfile][0] == 'discovered'
+    assert list(results[hwhfile][2]) == ['pipeline0/axis_switch',
+                                         'pipeline1/axis_switch']
+    assert parser.prewarm([hwhfile], 1)[hwhfile][0] == 'cached'
@@ -115,3 +115,80 @@ def test_data_return(ipdevice):
     tvector = np.arange(desc["parameters"]["C_NUM_MI_SLOTS"], dtype=np.int64)
     sw.pi = tvector
     assert np.array_equal(sw.pi, tvector)
+
+
+desc16 = {"parameters":
+          {"C_BASEADDR": "0x0", "C_HIGHADDR": "0xFFFF", "C_NUM_MI_SLOTS": 16},
+          "phys_addr": 0x0, "addr_range": 0xFFFF}
+
+
+def test_differential_writes(ipdevice):
+    sw = switch.StreamSwitch(desc16)
+    sw.pi = np.arange(16, dtype=np.int64)
+    assert sw.register_writes == 17
+
+    ipdevice.ip.memory.clear()
+    tvector = np.arange(16, dtype=np.int64)
+    tvector[[3, 9]] = [9, -1]
+    sw.pi = tvector
+    assert sw.register_writes == 3
+    assert ipdevice.ip.memory == {'76': 9, '100': 1 << 31, '0': 2}
+
+    ipdevice.ip.memory.clear()
+    sw.pi = tvector.copy()
+    assert sw.register_writes == 0
+    assert ipdevice.ip.memory == {}
+
+    sw.disable()
+    assert sw.register_writes == 16
+
+
+def test_shadow_reads(ipdevice, monkeypatch):
+    sw = switch.StreamSwitch(desc16)
+    tvector = np.arange(5, dtype=np.int64)
+    sw.pi = tvector.copy()
+    expected = np.append(tvector, np.full(11, 1 << 31))
+    assert len(sw.verify()) == 0
+
+    def fail(*args):
+        raise AssertionError("Unexpected register read")
+
+    monkeypatch.setattr(sw, 'read', fail)
+    monkeypatch.setattr(sw, '_read_mi', fail)
+    assert sw.pi.dtype == np.int64
+    assert np.array_equal(sw.pi, expected)
+
+
+def test_verify_refresh(ipdevice):
+    ipdevice.ip.memory.update({str(0x40 + 4 * i): i for i in range(8)})
+    sw = switch.StreamSwitch(desc)
+    assert np.array_equal(sw.pi, np.arange(8))
+
+    ipdevice.ip.memory['72'] = 5
+    ipdevice.ip.memory['92'] = 1 << 31
+    assert sw.verify().tolist() == [2, 7]
+    assert sw.pi[2] == 2
+
+    assert sw.refresh().tolist() == [0, 1, 5, 3, 4, 5, 6, 1 << 31]
+    assert len(sw.verify()) == 0
+    sw.pi = np.arange(8, dtype=np.int64)
+    assert sw.register_writes == 3
+
+
+def test_shared_shadow(ipdevice):
+    a = switch.StreamSwitch(desc)
+    b = switch.StreamSwitch(desc)
+    a.pi = np.arange(8, dtype=np.int64)
+    assert np.array_equal(b.pi, np.arange(8))
+
+    b.pi = np.arange(8, dtype=np.int64)[::-1].copy()
+    a.pi = np.arange(8, dtype=np.int64)[::-1].copy()
+    assert a.register_writes == 0
+    assert len(a.verify()) == 0
+    assert np.array_equal(a.pi, np.arange(8)[::-1])
+
+    ipdevice.ip.memory['64'] = 3
+    a.invalidate()
+    assert a.pi[0] == 3
+    a.pi = np.arange(8, dtype=np.int64)[::-1].copy()
+    assert a.register_writes == 2